@@ -1,23 +1,48 @@
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from app.models_db import User
-from app.database import get_db
+from app.database import get_async_db
+from app.services.cache import MISSING, TTLCache
+import asyncio
+import logging
+import os
 import re
+import time
 from app.models import TokenData
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 SECRET_KEY = "ton_secret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24h
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# Coût bcrypt (2^rounds itérations) : les hachages d'un autre coût sont régénérés à la connexion
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Threads dédiés à bcrypt : une rafale de connexions n'occupe pas plus de cœurs que cela,
+# ni le pool de threads partagé par le reste de l'application
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# Au-delà de ce nombre d'opérations en attente ou en cours, réponse 503 immédiate
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
+# Utilisateurs authentifiés en cache, indexés par sujet du jeton (email) : une requête
+# authentifiée se limite alors à la vérification de la signature. TTL court : une
+# modification faite par un autre worker est prise en compte au plus tard à l'expiration
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+principal_cache = TTLCache("principals", ttl=PRINCIPAL_CACHE_TTL, maxsize=PRINCIPAL_CACHE_SIZE)
+
 
 def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
@@ -29,12 +54,138 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+class PasswordHasher:
+    """
+    Exécute bcrypt dans un pool de threads dédié et borné, avec une file d'attente limitée
+    et mesurée (attente avant exécution, durée de calcul, rejets).
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._stats = {
+            "hashes": 0, "verifications": 0, "rehashed": 0, "rejected": 0, "peak_pending": 0,
+            "total_wait_ms": 0.0, "max_wait_ms": 0.0, "total_run_ms": 0.0,
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            logger.warning(f"File bcrypt pleine ({self._pending} opérations), requête rejetée")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Trop de connexions simultanées, veuillez réessayer",
+                headers={"Retry-After": "1"},
+            )
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return fn(*args), started - submitted, time.perf_counter() - started
+
+        self._pending += 1
+        self._stats["peak_pending"] = max(self._stats["peak_pending"], self._pending)
+        try:
+            result, wait, run = await asyncio.get_running_loop().run_in_executor(self._get_executor(), timed)
+        finally:
+            self._pending -= 1
+        self._stats["total_wait_ms"] += wait * 1000
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait * 1000)
+        self._stats["total_run_ms"] += run * 1000
+        return result
+
+    async def hash(self, password: str) -> str:
+        result = await self._run(get_password_hash, password)
+        self._stats["hashes"] += 1
+        return result
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        result = await self._run(verify_password, password, hashed)
+        self._stats["verifications"] += 1
+        return result
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(mot de passe valide, nouveau hachage si le coût configuré a changé, sinon None)"""
+        valid, new_hash = await self._run(pwd_context.verify_and_update, password, hashed)
+        self._stats["verifications"] += 1
+        if new_hash:
+            self._stats["rehashed"] += 1
+        return valid, new_hash
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._stats
+        calls = stats["hashes"] + stats["verifications"]
+        return {
+            **stats,
+            "total_wait_ms": round(stats["total_wait_ms"], 1),
+            "max_wait_ms": round(stats["max_wait_ms"], 1),
+            "total_run_ms": round(stats["total_run_ms"], 1),
+            "avg_wait_ms": round(stats["total_wait_ms"] / calls, 2) if calls else 0.0,
+            "avg_run_ms": round(stats["total_run_ms"] / calls, 2) if calls else 0.0,
+            "pending": self._pending,
+            "queued": max(self._pending - self.workers, 0),
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "rounds": BCRYPT_ROUNDS,
+        }
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    return (await db.execute(select(User).where(User.email == email))).scalars().first()
+
+
+def _detached_copy(user: User) -> User:
+    """Copie des colonnes de l'utilisateur, détachée de toute session (partageable entre requêtes)"""
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+async def load_principal(db: AsyncSession, email: str) -> Optional[User]:
+    """Utilisateur du jeton, rattaché à la session de la requête ; sans requête SQL si en cache"""
+    cached = principal_cache.get(email)
+    if cached is not MISSING:
+        return await db.merge(cached, load=False)
+    user = await get_user_by_email(db, email)
+    if user is not None:
+        principal_cache.set(email, _detached_copy(user))
+    return user
+
+
+def invalidate_principal(*emails: Optional[str]) -> None:
+    for email in emails:
+        if email:
+            principal_cache.invalidate(email)
+
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # Coût bcrypt modifié (BCRYPT_ROUNDS) : hachage régénéré avec le mot de passe en clair disponible
+        user.hashed_password = new_hash
+        await db.commit()
+        invalidate_principal(user.email)
     return user
 
 
@@ -45,7 +196,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Session expirée, veuillez vous reconnecter",
@@ -58,7 +209,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == email).first()
+    user = await load_principal(db, email)
     if user is None:
         raise credentials_exception
     return user
@@ -74,9 +225,9 @@ class OAuth2PasswordBearerOptional(OAuth2PasswordBearer):
 oauth2_scheme_optional = OAuth2PasswordBearerOptional(tokenUrl="/api/token")
 
 
-def get_current_user_optional(
+async def get_current_user_optional(
     token: Optional[str] = Depends(oauth2_scheme_optional),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Optional[User]:
     if not token:
         return None
@@ -87,5 +238,5 @@ def get_current_user_optional(
             return None
     except JWTError:
         return None
-    user = db.query(User).filter(User.email == email).first()
+    user = await load_principal(db, email)
     return user
@@ -1,11 +1,26 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+import json
+import logging
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Moteur de stockage : "mysql" (serveur) ou "sqlite" (fichier local : déploiement mono-nœud, tests hors ligne)
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "mysql").lower()
+
 # Configuration MySQL
 MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "password")
@@ -13,28 +28,277 @@ MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
 MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
 MYSQL_DB = os.getenv("MYSQL_DB", "audit_db")
 
-# URL de connexion MySQL
-SQLALCHEMY_DATABASE_URL = (
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+# Configuration SQLite
+SQLITE_PATH = os.getenv("SQLITE_PATH", "audit.db")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", 64))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", 256))
+
+if DATABASE_BACKEND == "mysql":
+    # URL de connexion MySQL
+    SQLALCHEMY_DATABASE_URL = (
+        f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+    )
+    # Même base via le pilote asynchrone (routes et services de l'application)
+    ASYNC_SQLALCHEMY_DATABASE_URL = (
+        f"mysql+aiomysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+    )
+elif DATABASE_BACKEND == "sqlite":
+    SQLALCHEMY_DATABASE_URL = f"sqlite:///{SQLITE_PATH}"
+    ASYNC_SQLALCHEMY_DATABASE_URL = f"sqlite+aiosqlite:///{SQLITE_PATH}"
+else:
+    raise ValueError(f"DATABASE_BACKEND invalide : {DATABASE_BACKEND} (mysql ou sqlite)")
+
+# Réglages appliqués à chaque nouvelle connexion SQLite
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",  # les lectures ne sont plus bloquées par l'écriture en cours
+    "synchronous=NORMAL",  # fsync aux checkpoints seulement : durable en mode WAL
+    "foreign_keys=ON",  # ON DELETE CASCADE / SET NULL du schéma (désactivés par défaut)
+    f"busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",  # un écrivain attend le verrou au lieu d'échouer
+    f"cache_size=-{SQLITE_CACHE_MB * 1024}",  # en Kio quand la valeur est négative
+    "temp_store=MEMORY",
+    f"mmap_size={SQLITE_MMAP_MB * 1024 * 1024}",
 )
 
-# Création du moteur SQLAlchemy
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Écouteur "connect" des moteurs SQLite (synchrone et aiosqlite)"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def _compact_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+# Colonnes JSON : type natif sous MySQL ; sous SQLite, texte JSON compact en UTF-8
+# (json.dumps échappe par défaut chaque caractère accentué en \uXXXX)
+if DATABASE_BACKEND == "sqlite":
+    BACKEND_OPTIONS: Dict[str, Any] = {"json_serializer": _compact_json}
+    # Le pool réutilise les connexions d'un thread à l'autre (sessions fermées entre-temps)
+    SYNC_BACKEND_OPTIONS: Dict[str, Any] = {
+        **BACKEND_OPTIONS, "poolclass": QueuePool, "connect_args": {"check_same_thread": False}
+    }
+else:
+    BACKEND_OPTIONS = {}
+    SYNC_BACKEND_OPTIONS = {}
+
+# Pool de connexions (par processus worker) : connexions permanentes, connexions
+# supplémentaires en pic, attente maximale d'une connexion libre (s), durée de vie (s)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+# Au-delà de cette attente, l'obtention d'une connexion est journalisée avec la route en cause
+DB_SLOW_CHECKOUT_MS = float(os.getenv("DB_SLOW_CHECKOUT_MS", 100))
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": True,
+}
+
+# Route HTTP en cours (renseignée par un middleware) pour attribuer les attentes de connexion
+_current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+@contextmanager
+def current_route(route: str) -> Iterator[None]:
+    token = _current_route.set(route)
+    try:
+        yield
+    finally:
+        _current_route.reset(token)
+
+
+# Durée d'ouverture des nouvelles connexions pendant l'obtention en cours (None : hors obtention)
+_connect_ms: ContextVar[Optional[float]] = ContextVar("connect_ms", default=None)
+
+
+class PoolMetrics:
+    """Attente d'une connexion libre, ouverture des nouvelles connexions et pics d'utilisation du pool"""
+
+    def __init__(self, slow_checkout_ms: float):
+        self.slow_checkout_ms = slow_checkout_ms
+        self._stats = {
+            "checkouts": 0, "slow_checkouts": 0, "timeouts": 0,
+            "total_wait_ms": 0.0, "max_wait_ms": 0.0,
+            "connects": 0, "total_connect_ms": 0.0, "max_connect_ms": 0.0,
+            "peak_checked_out": 0, "peak_overflow": 0,
+        }
+
+    def record_checkout(self, pool: Pool, wait_ms: float) -> None:
+        stats = self._stats
+        stats["checkouts"] += 1
+        stats["total_wait_ms"] += wait_ms
+        stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+        stats["peak_checked_out"] = max(stats["peak_checked_out"], pool.checkedout())
+        stats["peak_overflow"] = max(stats["peak_overflow"], pool.overflow())
+        if wait_ms >= self.slow_checkout_ms:
+            stats["slow_checkouts"] += 1
+            logger.warning(
+                f"Connexion DB obtenue en {wait_ms:.0f} ms ({_current_route.get() or 'hors requête'}) : "
+                f"{pool.checkedout()} utilisée(s), overflow {max(pool.overflow(), 0)}/{DB_MAX_OVERFLOW}"
+            )
+
+    def record_connect(self, connect_ms: float) -> None:
+        stats = self._stats
+        stats["connects"] += 1
+        stats["total_connect_ms"] += connect_ms
+        stats["max_connect_ms"] = max(stats["max_connect_ms"], connect_ms)
+
+    def record_timeout(self, pool: Pool, wait_ms: float) -> None:
+        self._stats["timeouts"] += 1
+        logger.error(
+            f"Aucune connexion DB libre après {wait_ms:.0f} ms ({_current_route.get() or 'hors requête'}) : "
+            f"{pool.checkedout()} utilisée(s), pool {pool.size()} + overflow {DB_MAX_OVERFLOW}"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._stats
+        return {
+            **stats,
+            "total_wait_ms": round(stats["total_wait_ms"], 1),
+            "max_wait_ms": round(stats["max_wait_ms"], 1),
+            "avg_wait_ms": round(stats["total_wait_ms"] / stats["checkouts"], 2) if stats["checkouts"] else 0.0,
+            "total_connect_ms": round(stats["total_connect_ms"], 1),
+            "max_connect_ms": round(stats["max_connect_ms"], 1),
+            "avg_connect_ms": round(stats["total_connect_ms"] / stats["connects"], 2) if stats["connects"] else 0.0,
+        }
+
+
+pool_metrics = PoolMetrics(DB_SLOW_CHECKOUT_MS)
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """
+    Pool asynchrone mesurant l'attente d'une connexion libre (file du pool seule).
+    L'ouverture des nouvelles connexions est mesurée à part, et le pre-ping
+    (exécuté après _do_get) n'entre dans aucune des deux mesures.
+    """
+
+    def _do_get(self):
+        if _connect_ms.get() is not None:
+            # Appel récursif de QueuePool._do_get : déjà mesuré par l'appel englobant
+            return super()._do_get()
+        started = time.perf_counter()
+        token = _connect_ms.set(0.0)
+        try:
+            try:
+                record = super()._do_get()
+            except PoolTimeoutError:
+                pool_metrics.record_timeout(self, (time.perf_counter() - started) * 1000)
+                raise
+            wait_ms = (time.perf_counter() - started) * 1000 - _connect_ms.get()
+        finally:
+            _connect_ms.reset(token)
+        pool_metrics.record_checkout(self, max(wait_ms, 0.0))
+        return record
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        record = super()._create_connection()
+        connect_ms = (time.perf_counter() - started) * 1000
+        if _connect_ms.get() is not None:
+            _connect_ms.set(_connect_ms.get() + connect_ms)
+        pool_metrics.record_connect(connect_ms)
+        return record
+
+
+# Moteur synchrone : scripts d'administration (setup_database.py)
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
-    pool_pre_ping=True,
-    pool_recycle=3600,
+    **POOL_OPTIONS,
+    **SYNC_BACKEND_OPTIONS,
     echo=False  # Mettre à True pour voir les requêtes SQL
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Moteur asynchrone : les requêtes n'occupent plus la boucle d'événements pendant les I/O
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    poolclass=InstrumentedAsyncPool,
+    **POOL_OPTIONS,
+    **BACKEND_OPTIONS,
+    echo=False
+)
+
+if DATABASE_BACKEND == "sqlite":
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+# expire_on_commit=False : pas de rechargement implicite (impossible en asynchrone) après un commit
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
-# Fonction pour obtenir une session DB
+# Fonction pour obtenir une session DB (synchrone)
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
-        
\ No newline at end of file
+
+# Dépendance FastAPI : session asynchrone
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_engines() -> None:
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """État courant du pool du moteur asynchrone et mesures cumulées depuis le démarrage"""
+    pool = async_engine.pool
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+        "recycle": DB_POOL_RECYCLE,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # overflow() est négatif tant que le pool de base n'est pas plein
+        "overflow": max(pool.overflow(), 0),
+        **pool_metrics.stats(),
+    }
+
+
+# Comptage des requêtes SQL (détection des N+1 et des requêtes en double)
+SQL_QUERY_COUNT = os.getenv("SQL_QUERY_COUNT", "false").lower() in ("1", "true", "yes")
+
+_query_counter: ContextVar[Optional[Dict[str, Any]]] = ContextVar("query_counter", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter["count"] += 1
+        counter["statements"].append(statement)
+
+@contextmanager
+def count_queries() -> Iterator[Dict[str, Any]]:
+    """
+    Compte les requêtes SQL exécutées dans le bloc, sur les moteurs synchrone et
+    asynchrone (l'écouteur porte sur Engine, que AsyncEngine enveloppe), y compris
+    dans les tâches et threads lancés depuis le bloc, qui héritent du contexte :
+
+        with count_queries() as counter:
+            ...
+        counter["count"], counter["statements"]
+    """
+    counter = {"count": 0, "statements": []}
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
@@ -1,3 +1,4 @@
+import logging
 import os
 from pathlib import Path
 
@@ -8,10 +9,17 @@ from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
+from app.auth import password_hasher
+from app.database import SQL_QUERY_COUNT, count_queries, current_route, dispose_engines
 from app.routes import router 
+from app.services.exporter import shutdown_pdf_pool
+from app.services.http_client import close_http_client
+from app.services.jobs import job_queue
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 BASE_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = BASE_DIR.parent
 
@@ -42,6 +50,34 @@ app.add_middleware(
 
 app.include_router(router) 
 
+@app.middleware("http")
+async def db_route_context(request: Request, call_next):
+    """Route en cours, pour attribuer les attentes de connexion DB lentes"""
+    with current_route(f"{request.method} {request.url.path}"):
+        return await call_next(request)
+
+if SQL_QUERY_COUNT:
+    @app.middleware("http")
+    async def sql_query_count(request: Request, call_next):
+        """Nombre de requêtes SQL par appel, dans les logs et l'en-tête X-SQL-Queries"""
+        with count_queries() as counter:
+            response = await call_next(request)
+        response.headers["X-SQL-Queries"] = str(counter["count"])
+        logger.info(f"{request.method} {request.url.path} : {counter['count']} requête(s) SQL")
+        return response
+
+@app.on_event("startup")
+async def start_services():
+    await job_queue.recover()
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    await job_queue.shutdown()
+    await close_http_client()
+    shutdown_pdf_pool()
+    password_hasher.shutdown()
+    await dispose_engines()
+
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -66,6 +66,22 @@ class AuditResponse(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+class AuditJobCreated(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class AuditJobStatus(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    progress: int = 0
+    result: Optional[AuditResponse] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
 class StoredAudit(BaseModel):
     id: int
     api_key: str
@@ -80,11 +96,39 @@ class StoredAudit(BaseModel):
     business_info: Optional[dict] = None
     user_id: Optional[int] = None
 
+class AuditSummary(BaseModel):
+    id: int
+    name: str
+    location: str
+    score: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+class AuditSummaryListResponse(BaseModel):
+    audits: List[AuditSummary]
+    total: Optional[int] = None
+    page: Optional[int] = None
+    per_page: int
+    next_cursor: Optional[str] = None
+
+class AuditSearchHit(AuditSummary):
+    category: Optional[str] = None
+    address: Optional[str] = None
+    similarity: float
+
+class AuditSearchResponse(BaseModel):
+    query: str
+    results: List[AuditSearchHit]
+    limit: int
+    offset: int
+    has_more: bool
+
 class AuditListResponse(BaseModel):
     audits: List[AuditOut]
-    total: int
-    page: int
+    total: Optional[int] = None
+    page: Optional[int] = None
     per_page: int
+    next_cursor: Optional[str] = None
 
 class UserBase(BaseModel):
     email: EmailStr
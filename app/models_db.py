@@ -1,5 +1,5 @@
 # models_db.py
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, JSON, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, JSON, ForeignKey, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -50,11 +50,16 @@ class Audit(Base):
     strengths = Column(JSON, nullable=True)
     weaknesses = Column(JSON, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    api_key = Column(String, nullable=True)
+    api_key = Column(String(64), unique=True, index=True, nullable=True)
 
     user = relationship("User", back_populates="audits")
     business_info = relationship("BusinessInfo", back_populates="audit", uselist=False)
 
+    __table_args__ = (
+        # Pagination par curseur des audits d'un utilisateur (created_at, id décroissants)
+        Index("ix_audits_user_created_id", "user_id", "created_at", "id"),
+    )
+
 class BusinessInfo(Base):
     __tablename__ = "business_info"
 
@@ -75,6 +80,39 @@ class BusinessInfo(Base):
 
     audit = relationship("Audit", back_populates="business_info")
 
+class AuditSearchTrigram(Base):
+    """Index de recherche par trigrammes (nom, localisation, catégorie, adresse), maintenu à l'écriture"""
+    __tablename__ = "audit_search_trigrams"
+
+    audit_id = Column(Integer, ForeignKey("audits.id", ondelete="CASCADE"), primary_key=True)
+    trigram = Column(String(3), primary_key=True)
+    user_id = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # Listes de trigrammes lues par index seul, éventuellement restreintes à un utilisateur
+        Index("ix_audit_search_trigram_user", "trigram", "user_id", "audit_id"),
+    )
+
+class Report(Base):
+    __tablename__ = "reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)
+    filename = Column(String(255), unique=True, index=True, nullable=False)
+    path = Column(String(500), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    download_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class AuditReport(Base):
+    """Lien audit -> rapport : un même fichier dédupliqué peut servir plusieurs audits"""
+    __tablename__ = "audit_reports"
+
+    audit_id = Column(Integer, ForeignKey("audits.id", ondelete="CASCADE"), primary_key=True)
+    report_id = Column(Integer, ForeignKey("reports.id", ondelete="CASCADE"), primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Session(Base):
     __tablename__ = "sessions"
 
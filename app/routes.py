@@ -1,41 +1,56 @@
 
 
+import asyncio
+import json
 import logging
 import os
 from pathlib import Path
 import traceback
 from typing import Optional
-import uuid
-from app.models_db import Audit, BusinessInfo
+from app.models_db import Audit
 from app.models_db import User as DBUser
 
-from fastapi import APIRouter, HTTPException, Depends, Query, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import func, select, text
 from datetime import timedelta
 from dotenv import load_dotenv
 import google.generativeai as genai
 
 from app.auth import (
-    get_password_hash, authenticate_user, create_access_token,
-    get_current_user, get_current_user_optional, verify_password
+    authenticate_user, create_access_token,
+    get_current_user, get_current_user_optional, invalidate_principal, password_hasher, principal_cache
 )
-from app.database import get_db
+from app.database import AsyncSessionLocal, get_async_db, pool_stats
 from app.models import (
-    AuditRequest, AuditResponse, StoredAudit, AuditListResponse, AuditOut,
-    RecommendationsByPeriod, DetailItem, UserCreate, UpdateProfile, UserProfile
+    AuditRequest, AuditResponse, StoredAudit, AuditListResponse, AuditOut, AuditSummaryListResponse,
+    AuditSearchResponse,
+    AuditJobCreated, AuditJobStatus, UserCreate, UpdateProfile, UserProfile
 )
 from app.models_db import User
-from app.services.analyzer import analyze_data
-from app.services.exporter import export_to_pdf
-from app.services.reporter import generate_action_plan
-from app.services.scraper import scrape_business_profile
+from app.services.analyzer import website_probe_stats
+from app.services.batch import (
+    AUDIT_BATCH_ANONYMOUS_MAX_ITEMS, AUDIT_BATCH_CONCURRENCY, parse_batch_payload, run_batch
+)
+from app.services.crawler import crawl_cache
+from app.services.downloads import (
+    IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, download_response, file_digest, strong_etag
+)
+from app.services.exporter import pdf_render_cache
+from app.services.jobs import job_queue
+from app.services.pipeline import run_audit
+from app.services.ratelimit import rate_limiter
+from app.services.report_store import report_store
+from app.services.scraper import serpapi_cache
+from app.services.search import search_audits
 from app.services.db import (
     save_audit_to_db, get_audit_by_id, get_audit_by_api_key,
     get_all_audits, get_audits_by_name, delete_audit, audit_to_dict,
-    get_recommendations_structured, get_audits_by_user_id
+    get_recommendations_structured, get_audits_by_user_id, get_audits_page_by_user
 )
 
 load_dotenv()
@@ -49,36 +64,7 @@ router = APIRouter(
 logger = logging.getLogger(__name__)
 
 
-def to_detail_items(lst):
-    result = []
-    for item in lst or []:
-        if isinstance(item, str):
-            result.append({"titre": item, "description": ""})
-        elif isinstance(item, dict):
-            titre = item.get("titre") or item.get("title") or ""
-            description = item.get("description", "")
-            result.append({"titre": titre, "description": description})
-    return result
-
-
-def to_action_items(lst, priority="medium"):
-    result = []
-    for item in lst or []:
-        if isinstance(item, str):
-            result.append({"title": item, "description": "", "priority": priority})
-        elif isinstance(item, dict):
-            title = item.get("title") or item.get("titre") or ""
-            description = item.get("description", "")
-            p = item.get("priority") or priority
-            result.append({"title": title, "description": description, "priority": p})
-    return result
-
-
-def get_audit_with_details(db: Session, audit_id: int):
-    audit = db.query(Audit).filter(Audit.id == audit_id).first()
-    if not audit:
-        return None
-
+def audit_details(audit: Audit):
     return {
         "id": audit.id,
         "api_key": audit.api_key,
@@ -91,25 +77,37 @@ def get_audit_with_details(db: Session, audit_id: int):
         "created_at": audit.created_at,
         "updated_at": audit.updated_at,
         "business_info": {
-            "name": audit.business_info.name if audit.business_info else None,
-            "address": audit.business_info.address if audit.business_info else None,
-            "website": audit.business_info.website if audit.business_info else None,
-            "phone": audit.business_info.phone if audit.business_info else None,
-            "rating": audit.business_info.rating if audit.business_info else None,
-            "review_count": audit.business_info.review_count if audit.business_info else None,
-            "photos": audit.business_info.photos if audit.business_info else None
+            "name": audit.business_info.name,
+            "address": audit.business_info.address,
+            "website": audit.business_info.website,
+            "phone": audit.business_info.phone,
+            "rating": audit.business_info.rating,
+            "review_count": audit.business_info.review_count,
+            "photos": audit.business_info.photos
         } if audit.business_info else None,
         "user_id": audit.user_id
     }
 
 
+async def get_audit_with_details(db: AsyncSession, audit_id: int):
+    # business_info chargé dans la même requête (jointure) : pas de chargement paresseux
+    audit = (await db.execute(
+        select(Audit)
+        .options(joinedload(Audit.business_info))
+        .where(Audit.id == audit_id)
+    )).scalars().first()
+    if not audit:
+        return None
+    return audit_details(audit)
+
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     stmt = select(User).where(User.email == user.email)
-    existing_user = db.execute(stmt).scalars().first()
+    existing_user = (await db.execute(stmt)).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email déjà utilisé")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     new_user = User(
         email=user.email,
         hashed_password=hashed_password,
@@ -117,8 +115,8 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         prenom=user.prenom
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return {
         "msg": "Utilisateur créé",
         "user": {
@@ -132,8 +130,8 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Email ou mot de passe incorrect")
     access_token_expires = timedelta(minutes=1440)
@@ -155,20 +153,24 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 
 
 @router.put("/user/profile", response_model=UserProfile)
-def update_profile(update_data: UpdateProfile, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def update_profile(update_data: UpdateProfile, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     try:
         logger.info(f"Début mise à jour profil pour utilisateur ID: {current_user.id}")
         logger.info(f"Données reçues: nom={update_data.nom}, prenom={update_data.prenom}, email={update_data.email}")
 
-        if not verify_password(update_data.current_password, current_user.hashed_password):
+        # L'utilisateur peut venir du cache des principaux : état relu en base avant vérification
+        await db.refresh(current_user)
+        previous_email = current_user.email
+
+        if not await password_hasher.verify(update_data.current_password, current_user.hashed_password):
             logger.warning("Mot de passe actuel incorrect")
             raise HTTPException(status_code=400, detail="Mot de passe actuel incorrect")
 
         if update_data.email and update_data.email != current_user.email:
-            existing_user = db.query(User).filter(
+            existing_user = (await db.execute(select(User).where(
                 User.email == update_data.email,
                 User.id != current_user.id
-            ).first()
+            ))).scalars().first()
             if existing_user:
                 logger.warning(f"Email {update_data.email} déjà utilisé par un autre utilisateur")
                 raise HTTPException(status_code=400, detail="Cette adresse email est déjà utilisée")
@@ -186,11 +188,12 @@ def update_profile(update_data: UpdateProfile, db: Session = Depends(get_db), cu
             logger.info(f"Email mis à jour: {update_data.email}")
 
         if update_data.new_password:
-            current_user.hashed_password = get_password_hash(update_data.new_password)
+            current_user.hashed_password = await password_hasher.hash(update_data.new_password)
             logger.info("Mot de passe mis à jour")
 
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        invalidate_principal(previous_email, current_user.email)
+        await db.refresh(current_user)
 
         logger.info("Profil mis à jour avec succès")
 
@@ -202,12 +205,12 @@ def update_profile(update_data: UpdateProfile, db: Session = Depends(get_db), cu
             name=f"{current_user.prenom or ''} {current_user.nom or ''}".strip()
         )
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception as e:
         logger.error(f"Erreur lors de la mise à jour du profil: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Erreur interne lors de la mise à jour")
 
 
@@ -225,7 +228,8 @@ def get_profile(current_user: User = Depends(get_current_user)):
 @router.post("/audit", response_model=AuditResponse)
 async def audit_business(
     request: AuditRequest,
-    db: Session = Depends(get_db),
+    mode: str = Query("sync", description="sync : réponse complète | job : renvoie un identifiant de job"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[DBUser] = Depends(get_current_user_optional)
 ):
     try:
@@ -234,195 +238,280 @@ async def audit_business(
         else:
             print("🔴 Aucun utilisateur connecté - audit sera anonyme (user_id=None)")
 
-        business_data = scrape_business_profile(request.name, request.location)
-        if not business_data:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Aucune entreprise trouvée : '{request.name}' à {request.location}"
+        if mode == "job":
+            job = await job_queue.submit(request, current_user.id if current_user else None)
+            created = AuditJobCreated(
+                job_id=job["job_id"],
+                status=job["status"],
+                status_url=f"/api/audit/jobs/{job['job_id']}"
             )
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(created))
+        if mode != "sync":
+            raise HTTPException(status_code=400, detail="Mode invalide (sync ou job)")
 
-        analysis = analyze_data({
-            "name": request.name,
-            "location": request.location,
-            "website": business_data.get("website"),
-            "reviews": business_data.get("reviews", [])
-        })
+        return await run_audit(db, request, current_user.id if current_user else None)
 
-        if analysis.get("message"):
-            return analysis
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur inattendue : {e}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="Erreur interne : voir logs.")
 
-        action_plan = generate_action_plan(analysis)
 
-        strengths = to_detail_items(analysis.get("strengths", analysis.get("forces", [])))
-        weaknesses = to_detail_items(analysis.get("weaknesses", analysis.get("faiblesses", [])))
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
 
-        short_term = to_action_items(action_plan.get("short_term", []), priority="short_term")
-        mid_term = to_action_items(action_plan.get("mid_term", []), priority="mid_term")
-        long_term = to_action_items(action_plan.get("long_term", []), priority="long_term")
 
-        api_key = str(uuid.uuid4())
+@router.get("/audit/stream")
+async def stream_audit(
+    name: str = Query(...),
+    location: str = Query(...),
+    current_user: Optional[DBUser] = Depends(get_current_user_optional)
+):
+    request = AuditRequest(name=name, location=location)
+    user_id = current_user.id if current_user else None
+    events: asyncio.Queue = asyncio.Queue()
 
-        new_audit = Audit(
-            name=request.name,
-            location=request.location,
-            score=analysis.get("score", 0),
-            recommandations=action_plan,
-            strengths=strengths,
-            weaknesses=weaknesses,
-            user_id=current_user.id if current_user else None,
-            api_key=api_key
-        )
+    async def progress(stage: str, data: dict):
+        await events.put((stage, data))
 
-        db.add(new_audit)
-        db.commit()
-        db.refresh(new_audit)
-
-        if business_data:
-            business_info = BusinessInfo(
-                audit_id=new_audit.id,
-                name=business_data.get("name", request.name),
-                address=business_data.get("address", ""),
-                website=business_data.get("website"),
-                phone=business_data.get("phone"),
-                rating=business_data.get("rating", 0.0),
-                review_count=business_data.get("review_count", 0),
-                place_id=business_data.get("place_id"),
-                latitude=business_data.get("gps_coordinates", {}).get("latitude") if business_data.get("gps_coordinates") else None,
-                longitude=business_data.get("gps_coordinates", {}).get("longitude") if business_data.get("gps_coordinates") else None,
-                category=business_data.get("category"),
-                photos=business_data.get("photos", [])
-            )
-            db.add(business_info)
-            db.commit()
-
-       
-        pdf_data = {
-            "business_data": business_data,
-            "score": analysis.get("score", 0),
-            "strengths": strengths,
-            "weaknesses": weaknesses,
-            "short_term": short_term,  
-            "mid_term": mid_term,
-            "long_term": long_term,
-            "model_used": "gemini-pro"
-        }
+    async def on_token(text: str):
+        await events.put(("analysis_token", {"text": text}))
 
-        pdf_path = None
+    async def run():
+        db = AsyncSessionLocal()
         try:
-            pdf_path = export_to_pdf(pdf_data)
-            print(f"✅ PDF généré avec succès: {pdf_path}")
-        except Exception as pdf_error:
-            print(f"❌ Erreur génération PDF: {pdf_error}")
-            logger.error(f"Erreur PDF: {pdf_error}")
-
-        recommendations = RecommendationsByPeriod(
-            short_term=[DetailItem(**item) for item in to_detail_items(action_plan.get("short_term", []))],
-            mid_term=[DetailItem(**item) for item in to_detail_items(action_plan.get("mid_term", []))],
-            long_term=[DetailItem(**item) for item in to_detail_items(action_plan.get("long_term", []))]
+            result = await run_audit(db, request, user_id, progress=progress, on_token=on_token)
+            if isinstance(result, dict) and result.get("message"):
+                await events.put(("done", {"message": result["message"]}))
+            else:
+                await events.put(("done", result))
+        except HTTPException as e:
+            await events.put(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            logger.error(f"Erreur inattendue (stream) : {e}\n{traceback.format_exc()}")
+            await events.put(("error", {"status_code": 500, "detail": "Erreur interne : voir logs."}))
+        finally:
+            await db.close()
+            await events.put(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                item = await events.get()
+                if item is None:
+                    break
+                stage, data = item
+                yield _sse_event(stage, data)
+        finally:
+            # Client déconnecté : inutile de poursuivre l'audit
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/audit/batch")
+async def audit_batch(
+    http_request: Request,
+    concurrency: int = Query(AUDIT_BATCH_CONCURRENCY, ge=1),
+    current_user: Optional[DBUser] = Depends(get_current_user_optional)
+):
+    try:
+        requests = parse_batch_payload(await http_request.body(), http_request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not current_user and len(requests) > AUDIT_BATCH_ANONYMOUS_MAX_ITEMS:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Authentification requise pour un lot de plus de {AUDIT_BATCH_ANONYMOUS_MAX_ITEMS} audits"
         )
 
-        return AuditResponse(
-            id=new_audit.id,
-            api_key=api_key,
-            business_data=business_data,
-            score=analysis.get("score", 0),
-            strengths=strengths,
-            weaknesses=weaknesses,
-            recommendations=recommendations,
-            short_term=short_term,
-            mid_term=mid_term,
-            long_term=long_term,
-            pdf_url=pdf_path or None,
-            created_at=new_audit.created_at
+    user_id = current_user.id if current_user else None
+    logger.info(f"Lot de {len(requests)} audits lancé (concurrence: {concurrency})")
+
+    async def ndjson_stream():
+        async for item in run_batch(requests, user_id, concurrency):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
+@router.get("/audit/jobs/{job_id}", response_model=AuditJobStatus)
+async def get_audit_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job d'audit non trouvé")
+    return job
+
+
+async def _user_audits_page(db: AsyncSession, user_id: int, skip: int, limit: int, cursor: Optional[str],
+                            with_total: bool, summary: bool):
+    try:
+        audits, next_cursor = await get_audits_page_by_user(
+            db, user_id, limit, cursor=cursor, skip=skip, summary=summary
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    total = None
+    if with_total:
+        total = (await db.execute(select(func.count(Audit.id)).where(Audit.user_id == user_id))).scalar()
+
+    audit_list = []
+    for audit in audits:
+        audit_out = {
+            "id": audit.id,
+            "name": audit.name,
+            "location": audit.location or "Non spécifiée",
+            "score": audit.score or 0,
+            "created_at": audit.created_at,
+            "updated_at": audit.updated_at
+        }
+        if not summary:
+            audit_out.update(
+                recommandations=audit.recommandations or {},
+                strengths=audit.strengths or [],
+                weaknesses=audit.weaknesses or []
+            )
+        audit_list.append(audit_out)
+
+    return {
+        "audits": audit_list,
+        "total": total,
+        "page": None if cursor else (skip // limit) + 1,
+        "per_page": limit,
+        "next_cursor": next_cursor
+    }
+
 
+@router.get("/user/audits", response_model=AuditListResponse)
+async def get_user_audits(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    with_total: bool = Query(True, description="Calculer le nombre total d'audits (COUNT)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        return await _user_audits_page(db, current_user.id, skip, limit, cursor, with_total, summary=False)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Erreur inattendue : {e}\n{traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail="Erreur interne : voir logs.")
+        logger.error(f"Erreur lors de la récupération des audits: {e}")
+        raise HTTPException(status_code=500, detail="Erreur lors de la récupération des audits")
 
 
-@router.get("/user/audits", response_model=AuditListResponse)
-async def get_user_audits(
+@router.get("/user/audits/summary", response_model=AuditSummaryListResponse)
+async def get_user_audits_summary(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    with_total: bool = Query(True, description="Calculer le nombre total d'audits (COUNT)"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
+    """Liste légère (sans recommandations, forces ni faiblesses) : le détail s'obtient via /audit/{id}"""
     try:
-        audits_query = (
-            db.query(Audit)
-            .filter(Audit.user_id == current_user.id)
-            .order_by(Audit.created_at.desc())
-        )
+        return await _user_audits_page(db, current_user.id, skip, limit, cursor, with_total, summary=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des audits: {e}")
+        raise HTTPException(status_code=500, detail="Erreur lors de la récupération des audits")
 
-        total = audits_query.count()
-        audits = audits_query.offset(skip).limit(limit).all()
 
-        audit_list = []
-        for audit in audits:
-            audit_out = {
+@router.get("/audits/search", response_model=AuditSearchResponse)
+async def search_user_audits(
+    q: str = Query(..., min_length=2, description="Nom, localisation, catégorie ou adresse"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10_000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    results, has_more = await search_audits(db, q, user_id=current_user.id, limit=limit, offset=offset)
+    return {
+        "query": q,
+        "results": [
+            {
                 "id": audit.id,
                 "name": audit.name,
                 "location": audit.location or "Non spécifiée",
                 "score": audit.score or 0,
                 "created_at": audit.created_at,
                 "updated_at": audit.updated_at,
-                "recommandations": audit.recommandations or {},
-                "strengths": audit.strengths or [],
-                "weaknesses": audit.weaknesses or []
+                "category": audit.business_info.category if audit.business_info else None,
+                "address": audit.business_info.address if audit.business_info else None,
+                "similarity": similarity
             }
-            audit_list.append(audit_out)
-
-        return {
-            "audits": audit_list,
-            "total": total,
-            "page": (skip // limit) + 1,
-            "per_page": limit
-        }
-
-    except Exception as e:
-        logger.error(f"Erreur lors de la récupération des audits: {e}")
-        raise HTTPException(status_code=500, detail="Erreur lors de la récupération des audits")
+            for audit, similarity in results
+        ],
+        "limit": limit,
+        "offset": offset,
+        "has_more": has_more
+    }
 
 
 @router.get("/audit/{audit_id}", response_model=StoredAudit)
-async def get_audit(audit_id: int, db: Session = Depends(get_db)):
-    audit = get_audit_with_details(db, audit_id)
+async def get_audit(audit_id: int, db: AsyncSession = Depends(get_async_db)):
+    audit = await get_audit_with_details(db, audit_id)
     if not audit:
         raise HTTPException(status_code=404, detail="Audit non trouvé")
     return audit
 
 
 @router.get("/audit/api/{api_key}", response_model=StoredAudit)
-async def get_audit_by_key(api_key: str, db: Session = Depends(get_db)):
-    audit = db.query(Audit).filter(Audit.api_key == api_key).first()
+async def get_audit_by_key(api_key: str, db: AsyncSession = Depends(get_async_db)):
+    audit = await get_audit_by_api_key(db, api_key)
     if not audit:
         raise HTTPException(status_code=404, detail="Audit non trouvé")
-    return get_audit_with_details(db, audit.id)
+    return audit_details(audit)
 
 
 @router.delete("/audit/{audit_id}")
-async def delete_audit_endpoint(audit_id: int, db: Session = Depends(get_db)):
-    audit = db.query(Audit).filter(Audit.id == audit_id).first()
-    if not audit:
+async def delete_audit_endpoint(audit_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await delete_audit(db, audit_id):
         raise HTTPException(status_code=404, detail="Audit non trouvé")
-    db.delete(audit)
-    db.commit()
+    pdf_render_cache.invalidate(audit_id)
     return {"message": "Audit supprimé avec succès"}
 
 
 @router.get("/audit/{audit_id}/recommendations")
-async def get_audit_recommendations(audit_id: int, db: Session = Depends(get_db)):
-    audit = get_audit_with_details(db, audit_id)
+async def get_audit_recommendations(audit_id: int, db: AsyncSession = Depends(get_async_db)):
+    audit = await get_audit_with_details(db, audit_id)
     if not audit:
         raise HTTPException(status_code=404, detail="Audit non trouvé")
     return audit.get("recommendations", {})
 
 
+@router.get("/audit/{audit_id}/pdf")
+async def download_audit_pdf(audit_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    try:
+        report = await pdf_render_cache.get(audit_id)
+    except Exception as e:
+        logger.error(f"Erreur génération PDF (audit {audit_id}): {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erreur lors de la génération du PDF")
+    if report is None:
+        raise HTTPException(status_code=404, detail="Audit non trouvé")
+
+    # Un rendu régénéré (après éviction) peut différer : revalidation plutôt que cache immuable
+    response = download_response(
+        request, strong_etag(report["etag"]), report["filename"], REVALIDATE_CACHE_CONTROL,
+        content=report["content"]
+    )
+    if report["report_id"] is not None:
+        await report_store.record_access(db, report["report_id"], download=response.status_code == 200)
+    return response
+
+
 @router.get("/export-pdf/{filename}")
-async def download_pdf(filename: str):
+async def download_pdf(filename: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     try:
         
         if not filename.endswith('.pdf'):
@@ -430,30 +519,32 @@ async def download_pdf(filename: str):
         
       
         safe_filename = os.path.basename(filename)
-        file_path = Path("reports") / safe_filename
-        
-        if not file_path.exists():
-            print(f"❌ Fichier PDF non trouvé: {file_path}")
-            raise HTTPException(status_code=404, detail="Fichier PDF non trouvé")
+        report = await report_store.resolve(db, safe_filename)
+        if report:
+            file_path = report_store.file_path(report)
+            file_size = report.size_bytes
+            etag = strong_etag(report.content_hash)
+        else:
+            # Rapports générés avant le stockage adressé par contenu
+            file_path = Path("reports") / safe_filename
             
-        file_size = file_path.stat().st_size
-        if file_size < 1000:  # Moins de 1KB
-            print(f"❌ Fichier PDF corrompu (taille: {file_size} bytes): {file_path}")
-            raise HTTPException(status_code=500, detail="Fichier PDF corrompu")
-        
-        print(f"✅ Téléchargement PDF: {file_path} ({file_size} bytes)")
+            if not file_path.exists():
+                print(f"❌ Fichier PDF non trouvé: {file_path}")
+                raise HTTPException(status_code=404, detail="Fichier PDF non trouvé")
+                
+            file_size = file_path.stat().st_size
+            if file_size < 1000:  # Moins de 1KB
+                print(f"❌ Fichier PDF corrompu (taille: {file_size} bytes): {file_path}")
+                raise HTTPException(status_code=500, detail="Fichier PDF corrompu")
+            etag = strong_etag(file_digest(file_path))
         
-        return FileResponse(
-            path=file_path,
-            media_type="application/pdf",
-            filename=safe_filename,
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{safe_filename}",
-                "Cache-Control": "no-cache, no-store, must-revalidate",
-                "Pragma": "no-cache",
-                "Expires": "0"
-            }
+        response = download_response(
+            request, etag, safe_filename, IMMUTABLE_CACHE_CONTROL,
+            path=file_path, size=file_size
         )
+        if report:
+            await report_store.record_access(db, report.id, download=response.status_code == 200)
+        return response
         
     except HTTPException:
         raise
@@ -463,9 +554,9 @@ async def download_pdf(filename: str):
 
 
 @router.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     try:
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         db_status = "OK"
     except Exception as e:
         db_status = f"Error: {str(e)}"
@@ -474,3 +565,18 @@ async def health_check(db: Session = Depends(get_db)):
         "database": db_status,
         "version": "1.0.0"
     }
+
+
+@router.get("/metrics")
+async def get_metrics(db: AsyncSession = Depends(get_async_db)):
+    return {
+        "serpapi_cache": serpapi_cache.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "website_probe": website_probe_stats(),
+        "crawl_cache": crawl_cache.stats(),
+        "reports": await report_store.stats(db),
+        "pdf_render_cache": pdf_render_cache.stats(),
+        "db_pool": pool_stats(),
+        "principal_cache": principal_cache.stats(),
+        "password_hashing": password_hasher.stats()
+    }
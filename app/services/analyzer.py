@@ -1,11 +1,21 @@
+import asyncio
 import json
 import logging
 import os
-from typing import Any, Dict, List
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 from dotenv import load_dotenv
 import google.generativeai as genai
-import requests
+import httpx
+
+from app.services.cache import MISSING, TTLCache
+from app.services.crawler import crawl_site, format_seo_signals
+from app.services.http_client import get_http_client
+from app.services.ratelimit import rate_limiter
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -14,13 +24,62 @@ if not GEMINI_API_KEY:
 
 MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_TOKENS", 4096))
+CRAWLER_ENABLED = os.getenv("CRAWLER_ENABLED", "true").lower() in ("1", "true", "yes")
 
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel(MODEL_NAME)
 
 logger = logging.getLogger(__name__)
 
-def check_website_exists(url: str) -> bool:
+WEBSITE_PROBE_TIMEOUT = float(os.getenv("WEBSITE_PROBE_TIMEOUT", 5))
+WEBSITE_PROBE_TTL = float(os.getenv("WEBSITE_PROBE_TTL", 300))
+WEBSITE_PROBE_NEGATIVE_TTL = float(os.getenv("WEBSITE_PROBE_NEGATIVE_TTL", 60))
+WEBSITE_PROBE_MAX_HOSTS = 1000
+
+# Résultats de la vérification par hôte (positifs et négatifs)
+website_probe_cache = TTLCache("website_probe", ttl=WEBSITE_PROBE_TTL, maxsize=WEBSITE_PROBE_MAX_HOSTS)
+# Latence des vérifications réseau par hôte
+_probe_latency: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+def _record_probe_latency(host: str, elapsed_ms: float, status_code: Optional[int], method: str) -> None:
+    stats = _probe_latency.pop(host, None) or {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+    stats["count"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    stats["last_ms"] = elapsed_ms
+    stats["last_status"] = status_code
+    stats["last_method"] = method
+    _probe_latency[host] = stats
+    while len(_probe_latency) > WEBSITE_PROBE_MAX_HOSTS:
+        _probe_latency.popitem(last=False)
+
+def website_probe_stats() -> Dict[str, Any]:
+    return {
+        "cache": website_probe_cache.stats(),
+        "hosts": {
+            host: {
+                "count": stats["count"],
+                "avg_ms": round(stats["total_ms"] / stats["count"], 1),
+                "max_ms": round(stats["max_ms"], 1),
+                "last_ms": round(stats["last_ms"], 1),
+                "last_status": stats["last_status"],
+                "last_method": stats["last_method"],
+            }
+            for host, stats in _probe_latency.items()
+        }
+    }
+
+async def _probe(url: str) -> Tuple[int, str]:
+    """HEAD, puis GET limité au premier octet pour les serveurs qui refusent HEAD"""
+    client = get_http_client()
+    r = await client.head(url, timeout=WEBSITE_PROBE_TIMEOUT, follow_redirects=True)
+    if r.status_code < 400:
+        return r.status_code, "HEAD"
+    async with client.stream("GET", url, headers={"Range": "bytes=0-0"},
+                             timeout=WEBSITE_PROBE_TIMEOUT, follow_redirects=True) as r:
+        return r.status_code, "GET"
+
+async def check_website_exists(url: str) -> bool:
     if not url:
         print("DEBUG: URL vide ou None")
         return False
@@ -28,13 +87,24 @@ def check_website_exists(url: str) -> bool:
     if not url.startswith(("http://", "https://")):
         url = "https://" + url
 
+    host = urlsplit(url).netloc.lower()
+    cached = website_probe_cache.get(host)
+    if cached is not MISSING:
+        logger.debug(f"URL testée (cache) : {url} - Accessible : {cached}")
+        return cached
+
+    start = time.perf_counter()
+    status_code, method = None, "HEAD"
     try:
-        r = requests.head(url, timeout=5, allow_redirects=True)
-        print(f"DEBUG: URL testée : {url} - Status code : {r.status_code}")
-        return r.status_code < 400
-    except requests.RequestException as e:
+        status_code, method = await _probe(url)
+        logger.debug(f"URL testée : {url} - Status code : {status_code}")
+        ok = status_code < 400
+    except (httpx.HTTPError, httpx.InvalidURL) as e:
         print(f"DEBUG: Erreur requête HTTP pour {url} : {e}")
-        return False
+        ok = False
+    _record_probe_latency(host, (time.perf_counter() - start) * 1000, status_code, method)
+    website_probe_cache.set(host, ok, ttl=None if ok else WEBSITE_PROBE_NEGATIVE_TTL)
+    return ok
 
 def _normalize_list(lst: List[Any]) -> List[Dict[str, str]]:
     if not isinstance(lst, list):
@@ -55,74 +125,95 @@ def _normalize_list(lst: List[Any]) -> List[Dict[str, str]]:
             normalized.append({"title": title.strip(), "description": desc.strip()})
     return normalized
 
+# Mots-clés identifiant les faiblesses liées à l'absence d'avis
+MISSING_REVIEWS_KEYWORDS = [
+    # Français
+    "absence d'avis", "zéro avis", "pas d'avis", "aucun avis", "manque d'avis",
+    "peu d'avis", "insuffisant d'avis", "absence de retours", "manque de retours",
+    "pas de retours", "aucun retour", "zéro retour", "nombre d'avis faible",
+    "avis insuffisants", "retours insuffisants", "évaluations insuffisantes",
+    "pas d'évaluations", "aucune évaluation", "manque d'évaluations",
+    "absence d'évaluations", "nombre d'évaluations faible", "reviews insuffisants",
+    "pas de reviews", "aucun review", "manque de reviews", "absence de reviews",
+    "commentaires insuffisants", "pas de commentaires", "aucun commentaire",
+    "manque de commentaires", "absence de commentaires", "témoignages insuffisants",
+    "pas de témoignages", "aucun témoignage", "manque de témoignages",
+    "absence de témoignages", "feedback insuffisant", "pas de feedback",
+    "aucun feedback", "manque de feedback", "absence de feedback",
+    "avis clients", "retours clients", "évaluations clients",
+    # Variantes avec 0 et zéro
+    "0 avis", "0 retour", "0 évaluation", "0 commentaire", "0 témoignage",
+    "zero avis", "zero retour", "zero évaluation", "zero commentaire",
+    # Phrases complètes communes
+    "absence totale d'avis", "manque total d'avis", "aucun avis client",
+    "pas d'avis client", "zéro avis client", "0 avis client"
+]
+# Mots négatifs recherchés à proximité de "avis" (dans les 5 mots précédents)
+NEGATIVE_WORDS = ["absence", "zéro", "zero", "0", "aucun", "pas", "manque", "sans"]
+REVIEW_PROXIMITY_WINDOW = 5
+# Chaque mot-clé contient l'un de ces fragments : un texte qui n'en contient aucun
+# (cas le plus fréquent) est écarté sans passer par les expressions régulières
+_KEYWORD_ANCHORS = ("avis", "retour", "évaluation", "review", "commentaire", "témoignage", "feedback")
+
+def _literal_trie_pattern(words: List[str]) -> str:
+    """Regex équivalente à une alternance de littéraux, factorisée en arbre de préfixes"""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+# Compilés une seule fois à l'import
+_MISSING_REVIEWS_RE = re.compile(_literal_trie_pattern(MISSING_REVIEWS_KEYWORDS))
+# Mot contenant un mot négatif, suivi d'un mot contenant "avis" dans les 5 mots suivants
+_NEGATIVE_NEAR_REVIEWS_RE = re.compile(
+    "(?:" + "|".join(re.escape(w) for w in NEGATIVE_WORDS) + ")"
+    + r"\S*(?:\s+\S+){0," + str(REVIEW_PROXIMITY_WINDOW - 1) + r"}\s+\S*avis"
+)
+
+def _is_about_missing_reviews(text: str) -> bool:
+    """Indique si un texte (en minuscules) évoque l'absence ou le manque d'avis"""
+    if not any(anchor in text for anchor in _KEYWORD_ANCHORS):
+        return False
+    if _MISSING_REVIEWS_RE.search(text):
+        return True
+    return "avis" in text and _NEGATIVE_NEAR_REVIEWS_RE.search(text) is not None
+
 def _filter_invalid_weaknesses(weaknesses: List[Dict[str, str]], review_count: int) -> List[Dict[str, str]]:
     """Filtre les faiblesses invalides concernant l'absence d'avis quand des avis existent"""
     if review_count == 0:
         return weaknesses
     
-    # Mots-clés à rechercher pour identifier les faiblesses liées à l'absence d'avis
-    keywords_to_filter = [
-        # Français
-        "absence d'avis", "zéro avis", "pas d'avis", "aucun avis", "manque d'avis",
-        "peu d'avis", "insuffisant d'avis", "absence de retours", "manque de retours",
-        "pas de retours", "aucun retour", "zéro retour", "nombre d'avis faible",
-        "avis insuffisants", "retours insuffisants", "évaluations insuffisantes",
-        "pas d'évaluations", "aucune évaluation", "manque d'évaluations",
-        "absence d'évaluations", "nombre d'évaluations faible", "reviews insuffisants",
-        "pas de reviews", "aucun review", "manque de reviews", "absence de reviews",
-        "commentaires insuffisants", "pas de commentaires", "aucun commentaire",
-        "manque de commentaires", "absence de commentaires", "témoignages insuffisants",
-        "pas de témoignages", "aucun témoignage", "manque de témoignages",
-        "absence de témoignages", "feedback insuffisant", "pas de feedback",
-        "aucun feedback", "manque de feedback", "absence de feedback",
-        "avis clients", "retours clients", "évaluations clients",
-        # Variantes avec 0 et zéro
-        "0 avis", "0 retour", "0 évaluation", "0 commentaire", "0 témoignage",
-        "zero avis", "zero retour", "zero évaluation", "zero commentaire",
-        # Phrases complètes communes
-        "absence totale d'avis", "manque total d'avis", "aucun avis client",
-        "pas d'avis client", "zéro avis client", "0 avis client"
-    ]
-    
     filtered_weaknesses = []
     for weakness in weaknesses:
-        title_lower = weakness["title"].lower()
-        description_lower = weakness["description"].lower()
-        combined_text = f"{title_lower} {description_lower}"
-        
-        # Vérifier si cette faiblesse mentionne l'absence d'avis
-        is_about_missing_reviews = any(
-            keyword in combined_text for keyword in keywords_to_filter
-        )
-        
-        # Vérification supplémentaire pour les patterns avec "avis"
-        if not is_about_missing_reviews and "avis" in combined_text:
-            # Vérifier les patterns comme "absence... avis", "zéro... avis", etc.
-            negative_words = ["absence", "zéro", "zero", "0", "aucun", "pas", "manque", "sans"]
-            for neg_word in negative_words:
-                if neg_word in combined_text and "avis" in combined_text:
-                    # Vérifier si les mots sont proches
-                    words = combined_text.split()
-                    for i, word in enumerate(words):
-                        if neg_word in word:
-                            # Chercher "avis" dans les 5 mots suivants
-                            for j in range(i+1, min(i+6, len(words))):
-                                if "avis" in words[j]:
-                                    is_about_missing_reviews = True
-                                    break
-                            if is_about_missing_reviews:
-                                break
-                    if is_about_missing_reviews:
-                        break
+        combined_text = f"{weakness['title'].lower()} {weakness['description'].lower()}"
         
-        if not is_about_missing_reviews:
+        if not _is_about_missing_reviews(combined_text):
             filtered_weaknesses.append(weakness)
         else:
             print(f"DEBUG: Faiblesse filtrée (avis présents: {review_count}): {weakness['title']}")
     
     return filtered_weaknesses
 
-def analyze_data(data: Dict[str, Any]) -> Dict[str, Any]:
+async def analyze_data(data: Dict[str, Any],
+                       progress: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
+                       on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
+    """
+    Analyse SEO du commerce par Gemini.
+
+    progress est appelé avec ("website_checked", {...}) après la vérification du site,
+    on_token reçoit les fragments de la réponse Gemini au fil du streaming.
+    """
     try:
         name = data.get("name", "Inconnu")
         location = data.get("location", "Inconnue")
@@ -130,8 +221,16 @@ def analyze_data(data: Dict[str, Any]) -> Dict[str, Any]:
         review_count = len(reviews)
         website = data.get("website")
 
-        site_ok = check_website_exists(website)
+        # Vérification du site et crawl SEO en parallèle
+        if CRAWLER_ENABLED:
+            site_ok, seo_signals = await asyncio.gather(check_website_exists(website), crawl_site(website))
+        else:
+            site_ok, seo_signals = await check_website_exists(website), None
         print(f"DEBUG: Site web {'valide' if site_ok else 'invalide ou inaccessible'} pour URL: {website}")
+        if progress is not None:
+            await progress("website_checked", {"website": website, "reachable": site_ok})
+            if seo_signals:
+                await progress("seo_signals", {"seo_signals": seo_signals})
 
         if not site_ok:
             return {
@@ -197,23 +296,46 @@ Réponds UNIQUEMENT avec ce JSON, rien d'autre.
             f"- Site web: {website}\n"
             f"- Nombre d'avis: {review_count}\n"
             f"- Extraits d'avis:\n{reviews_summary}\n"
+            f"{format_seo_signals(seo_signals)}\n"
             f"Donne 2-3 forces, 2-3 faiblesses, et 2-3 recommandations par période."
         )
         print(f"DEBUG: Prompt envoyé à Gemini:\n{user_prompt}")
         print(f"DEBUG: Nombre d'avis détecté: {review_count}")
 
-        resp = model.generate_content(
-            [system_prompt, user_prompt],
-            generation_config={
-                "temperature": 0.7,
-                "max_output_tokens": MAX_OUTPUT_TOKENS,
-                "response_mime_type": "application/json"
-            }
-        )
-        if not resp.candidates or not resp.candidates[0].content.parts:
-            raise RuntimeError("Réponse vide de Gemini")
+        generation_config = {
+            "temperature": 0.7,
+            "max_output_tokens": MAX_OUTPUT_TOKENS,
+            "response_mime_type": "application/json"
+        }
+        await rate_limiter.acquire("gemini")
+        if on_token is None:
+            resp = await model.generate_content_async(
+                [system_prompt, user_prompt],
+                generation_config=generation_config
+            )
+            if not resp.candidates or not resp.candidates[0].content.parts:
+                raise RuntimeError("Réponse vide de Gemini")
+
+            raw_json = resp.candidates[0].content.parts[0].text
+        else:
+            # Mode streaming : chaque fragment est transmis dès sa réception
+            resp = await model.generate_content_async(
+                [system_prompt, user_prompt],
+                generation_config=generation_config,
+                stream=True
+            )
+            chunks = []
+            async for chunk in resp:
+                if not chunk.candidates or not chunk.candidates[0].content.parts:
+                    continue
+                text = "".join(part.text for part in chunk.candidates[0].content.parts)
+                if text:
+                    chunks.append(text)
+                    await on_token(text)
+            if not chunks:
+                raise RuntimeError("Réponse vide de Gemini")
 
-        raw_json = resp.candidates[0].content.parts[0].text
+            raw_json = "".join(chunks)
         print(f"DEBUG: Réponse brute de Gemini:\n{raw_json}")
 
         parsed = json.loads(raw_json)
@@ -0,0 +1,125 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from app.database import AsyncSessionLocal
+from app.models import AuditRequest
+from app.services.pipeline import run_audit
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_CONCURRENCY = int(os.getenv("AUDIT_BATCH_CONCURRENCY", 5))
+AUDIT_BATCH_MAX_CONCURRENCY = int(os.getenv("AUDIT_BATCH_MAX_CONCURRENCY", 20))
+AUDIT_BATCH_MAX_ITEMS = int(os.getenv("AUDIT_BATCH_MAX_ITEMS", 1000))
+# Lots sans authentification : chaque audit coûte des appels SerpAPI et Gemini
+AUDIT_BATCH_ANONYMOUS_MAX_ITEMS = int(os.getenv("AUDIT_BATCH_ANONYMOUS_MAX_ITEMS", 10))
+
+
+def parse_batch_payload(body: bytes, content_type: str) -> List[AuditRequest]:
+    """
+    Convertit le corps de la requête en liste d'AuditRequest.
+
+    Formats acceptés :
+        - JSON : [{"name": ..., "location": ...}, ...] ou {"items": [...]}
+        - CSV  : en-tête avec les colonnes name et location
+    """
+    text = body.decode("utf-8-sig")
+    if "csv" in (content_type or ""):
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or not {"name", "location"} <= {f.strip() for f in reader.fieldnames}:
+            raise ValueError("Le CSV doit contenir les colonnes 'name' et 'location'")
+        rows = [{(k or "").strip(): (v or "").strip() for k, v in row.items()} for row in reader]
+    else:
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON invalide : {e}")
+        rows = payload.get("items") if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError("Le corps doit être une liste d'audits ou un objet {\"items\": [...]}")
+
+    if not rows:
+        raise ValueError("Aucun audit à traiter")
+    if len(rows) > AUDIT_BATCH_MAX_ITEMS:
+        raise ValueError(f"Trop d'audits dans le lot (maximum {AUDIT_BATCH_MAX_ITEMS})")
+
+    requests = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict) or not row.get("name") or not row.get("location"):
+            raise ValueError(f"Ligne {i} invalide : 'name' et 'location' sont obligatoires")
+        requests.append(AuditRequest(name=row["name"], location=row["location"]))
+    return requests
+
+
+async def _run_item(index: int, request: AuditRequest, user_id: Optional[int],
+                    semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    item = {"index": index, "name": request.name, "location": request.location}
+    async with semaphore:
+        started = time.perf_counter()
+        db = AsyncSessionLocal()
+        try:
+            result = await run_audit(db, request, user_id)
+            if isinstance(result, dict) and result.get("message"):
+                item.update(status="skipped", message=result["message"])
+            else:
+                item.update(status="ok", result=jsonable_encoder(result))
+        except HTTPException as e:
+            item.update(status="error", error=str(e.detail))
+        except Exception as e:
+            logger.error(f"Audit du lot échoué ({request.name}, {request.location}): {e}", exc_info=True)
+            item.update(status="error", error="Erreur interne : voir logs.")
+        finally:
+            await db.close()
+        item["duration_seconds"] = round(time.perf_counter() - started, 3)
+    return item
+
+
+async def run_batch(requests: List[AuditRequest], user_id: Optional[int] = None,
+                    concurrency: int = AUDIT_BATCH_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Exécute les audits avec une concurrence bornée et produit chaque résultat dès qu'il est prêt,
+    puis un résumé final. L'échec d'un audit n'interrompt pas le lot.
+    """
+    concurrency = max(1, min(concurrency, AUDIT_BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+
+    tasks = [
+        asyncio.create_task(_run_item(i, request, user_id, semaphore))
+        for i, request in enumerate(requests)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            counts[item["status"]] += 1
+            yield item
+    finally:
+        # Client déconnecté : on annule les audits restants
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    elapsed = time.perf_counter() - started
+    yield {
+        "summary": {
+            "total": len(requests),
+            "succeeded": counts["ok"],
+            "skipped": counts["skipped"],
+            "failed": counts["error"],
+            "concurrency": concurrency,
+            "elapsed_seconds": round(elapsed, 3),
+            "audits_per_minute": round(len(requests) / elapsed * 60, 2) if elapsed > 0 else None,
+        }
+    }
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Valeur sentinelle pour distinguer "absent du cache" d'une valeur None
+MISSING = object()
+
+
+def normalize_key(*parts: Any) -> str:
+    """Construit une clé de cache insensible à la casse, aux accents et aux espaces multiples"""
+    normalized = []
+    for part in parts:
+        text = unicodedata.normalize("NFKD", str(part or ""))
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        normalized.append(" ".join(text.casefold().split()))
+    return "|".join(normalized)
+
+
+class TTLCache:
+    """
+    Cache clé/valeur avec expiration (TTL) et éviction LRU en mémoire,
+    doublé d'un niveau SQLite optionnel qui survit aux redémarrages.
+
+    Les valeurs du niveau disque doivent être sérialisables en JSON.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 1024, db_path: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.db_path = db_path or None
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0, "expired": 0}
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries ("
+                    "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                    "PRIMARY KEY (namespace, key))"
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _memory_get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                self._stats["expired"] += 1
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _disk_get(self, key: str) -> Any:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.name, key)
+                ).fetchone()
+                if row is None:
+                    return MISSING, None
+                if row[1] <= time.time():
+                    conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.name, key))
+                    return MISSING, None
+                return json.loads(row[0]), row[1]
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Cache {self.name} : lecture disque impossible: {e}")
+            return MISSING, None
+
+    def _disk_set(self, key: str, value: Any, expires_at: float) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.name, key, json.dumps(value, ensure_ascii=False), expires_at)
+                )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Cache {self.name} : écriture disque impossible: {e}")
+
+    def _disk_delete(self, key: str) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.name, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.name} : suppression disque impossible: {e}")
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get(self, key: str) -> Any:
+        """Retourne la valeur en cache ou MISSING"""
+        value = self._memory_get(key)
+        if value is not MISSING:
+            self._count("hits")
+            self._count("memory_hits")
+            return value
+        if self.db_path:
+            value, expires_at = self._disk_get(key)
+            if value is not MISSING:
+                self._memory_set(key, value, expires_at)
+                self._count("hits")
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return MISSING
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._memory_set(key, value, expires_at)
+        if self.db_path:
+            self._disk_set(key, value, expires_at)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+        if self.db_path:
+            self._disk_delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.name,))
+            except sqlite3.Error as e:
+                logger.warning(f"Cache {self.name} : purge disque impossible: {e}")
+
+    async def aget(self, key: str) -> Any:
+        """Version asynchrone de get() : le niveau disque est lu hors de la boucle d'événements"""
+        value = self._memory_get(key)
+        if value is not MISSING or not self.db_path:
+            self._count("hits" if value is not MISSING else "misses")
+            if value is not MISSING:
+                self._count("memory_hits")
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if self.db_path:
+            await asyncio.to_thread(self.set, key, value, ttl)
+        else:
+            self.set(key, value, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["maxsize"] = self.maxsize
+        stats["ttl"] = self.ttl
+        stats["persistent"] = bool(self.db_path)
+        return stats
@@ -0,0 +1,269 @@
+import asyncio
+import codecs
+import json
+import logging
+import os
+import time
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin, urlsplit, urldefrag
+
+import httpx
+from dotenv import load_dotenv
+
+from app.services.cache import MISSING, TTLCache
+from app.services.http_client import get_http_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CRAWLER_MAX_BYTES = int(os.getenv("CRAWLER_MAX_BYTES", 2 * 1024 * 1024))
+CRAWLER_TIMEOUT = float(os.getenv("CRAWLER_TIMEOUT", 10))
+CRAWLER_MAX_PAGES = int(os.getenv("CRAWLER_MAX_PAGES", 1))
+CRAWLER_USER_AGENT = "Mozilla/5.0 (compatible; AuditAgent/1.0)"
+# Signaux SEO mis en cache par site : un nouvel audit du même site ne retélécharge pas la page
+CRAWLER_CACHE_TTL = float(os.getenv("CRAWLER_CACHE_TTL", 3600))
+CRAWLER_CACHE_NEGATIVE_TTL = float(os.getenv("CRAWLER_CACHE_NEGATIVE_TTL", 60))
+CRAWLER_CACHE_MAX_SITES = 1000
+
+# Limites pour que le parseur garde une empreinte mémoire bornée
+MAX_H1 = 10
+MAX_LINKS = 200
+MAX_JSON_LD_CHARS = 100_000
+
+crawl_cache = TTLCache("crawl", ttl=CRAWLER_CACHE_TTL, maxsize=CRAWLER_CACHE_MAX_SITES)
+
+
+class SEOHTMLParser(HTMLParser):
+    """
+    Parseur HTML incrémental : le contenu est fourni par morceaux via feed()
+    et seuls les signaux SEO utiles sont conservés.
+    """
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.title = ""
+        self.meta_description = None
+        self.canonical = None
+        self.h1s: List[str] = []
+        self.image_count = 0
+        self.images_without_alt = 0
+        self.structured_data_types: List[str] = []
+        self.internal_links: List[str] = []
+        self._in_title = False
+        self._h1_buffer: Optional[List[str]] = None
+        self._json_ld_buffer: Optional[List[str]] = None
+        self._json_ld_size = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k.lower(): (v or "") for k, v in attrs}
+        if tag == "title":
+            self._in_title = True
+        elif tag == "h1":
+            self._h1_buffer = []
+        elif tag == "img":
+            self.image_count += 1
+            if not attrs.get("alt", "").strip():
+                self.images_without_alt += 1
+        elif tag == "meta" and attrs.get("name", "").lower() == "description":
+            if self.meta_description is None:
+                self.meta_description = attrs.get("content", "").strip()
+        elif tag == "link" and "canonical" in attrs.get("rel", "").lower().split():
+            if self.canonical is None:
+                self.canonical = attrs.get("href", "").strip()
+        elif tag == "script" and attrs.get("type", "").lower() == "application/ld+json":
+            self._json_ld_buffer = []
+            self._json_ld_size = 0
+        elif tag == "a" and attrs.get("href") and len(self.internal_links) < MAX_LINKS:
+            link = self._internal_link(attrs["href"])
+            if link and link not in self.internal_links:
+                self.internal_links.append(link)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in ("title", "h1", "script"):
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "h1" and self._h1_buffer is not None:
+            text = " ".join("".join(self._h1_buffer).split())
+            if text and len(self.h1s) < MAX_H1:
+                self.h1s.append(text[:200])
+            self._h1_buffer = None
+        elif tag == "script" and self._json_ld_buffer is not None:
+            self._collect_json_ld("".join(self._json_ld_buffer))
+            self._json_ld_buffer = None
+
+    def handle_data(self, data):
+        if self._in_title and len(self.title) < 500:
+            self.title += data
+        if self._h1_buffer is not None:
+            self._h1_buffer.append(data)
+        if self._json_ld_buffer is not None and self._json_ld_size < MAX_JSON_LD_CHARS:
+            self._json_ld_buffer.append(data)
+            self._json_ld_size += len(data)
+
+    def _internal_link(self, href: str) -> Optional[str]:
+        if href.startswith(("mailto:", "tel:", "javascript:", "#")):
+            return None
+        url, _ = urldefrag(urljoin(self.base_url, href))
+        if urlsplit(url).netloc.lower() != urlsplit(self.base_url).netloc.lower():
+            return None
+        return url
+
+    def _collect_json_ld(self, raw: str) -> None:
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            return
+        if isinstance(payload, list):
+            items = payload
+        elif isinstance(payload, dict):
+            # @graph n'est exploitable que sous forme de liste (ou d'objet unique)
+            graph = payload.get("@graph", [payload])
+            items = graph if isinstance(graph, list) else [graph] if isinstance(graph, dict) else []
+        else:
+            items = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            types = item.get("@type")
+            for t in types if isinstance(types, list) else [types]:
+                if isinstance(t, str) and t not in self.structured_data_types:
+                    self.structured_data_types.append(t)
+
+    def signals(self) -> Dict[str, Any]:
+        return {
+            "title": " ".join(self.title.split()) or None,
+            "meta_description": self.meta_description or None,
+            "h1": self.h1s,
+            "canonical": self.canonical,
+            "structured_data": self.structured_data_types,
+            "image_count": self.image_count,
+            "images_without_alt": self.images_without_alt,
+        }
+
+
+async def crawl_page(url: str, max_bytes: int = CRAWLER_MAX_BYTES) -> Dict[str, Any]:
+    """
+    Télécharge une page en streaming et l'analyse au fil de l'eau.
+    Au-delà de max_bytes, la lecture s'arrête : la mémoire consommée reste bornée
+    quelle que soit la taille de la page.
+    """
+    client = get_http_client()
+    parser = SEOHTMLParser(url)
+    start = time.perf_counter()
+    page_bytes = 0
+    truncated = False
+
+    async with client.stream("GET", url, timeout=CRAWLER_TIMEOUT, follow_redirects=True,
+                             headers={"User-Agent": CRAWLER_USER_AGENT, "Accept": "text/html"}) as response:
+        ttfb_ms = (time.perf_counter() - start) * 1000
+        parser.base_url = str(response.url)
+        content_type = response.headers.get("content-type", "")
+        encoding = response.encoding or "utf-8"
+        if "html" in content_type or not content_type:
+            try:
+                decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            async for chunk in response.aiter_bytes():
+                page_bytes += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if page_bytes >= max_bytes:
+                    truncated = True
+                    break
+            parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+        status_code = response.status_code
+
+    return {
+        "url": parser.base_url,
+        "status_code": status_code,
+        "ttfb_ms": round(ttfb_ms, 1),
+        "page_weight_bytes": page_bytes,
+        "truncated": truncated,
+        **parser.signals(),
+        "internal_links": parser.internal_links,
+    }
+
+
+async def crawl_site(url: str, max_pages: int = CRAWLER_MAX_PAGES) -> Optional[Dict[str, Any]]:
+    """
+    Analyse la page d'accueil (et éventuellement quelques liens internes)
+    et retourne les signaux SEO techniques, ou None si le site n'a pas pu être lu.
+    """
+    if not url:
+        return None
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+
+    # Clé par page d'accueil et non par hôte : plusieurs commerces partagent un hôte (pages de réseaux sociaux)
+    parts = urlsplit(url)
+    key = f"{max_pages}|{parts.scheme}://{parts.netloc.lower()}{parts.path or '/'}?{parts.query}"
+    cached = crawl_cache.get(key)
+    if cached is not MISSING:
+        return cached
+
+    signals = await _crawl_site(url, max_pages)
+    crawl_cache.set(key, signals, ttl=None if signals else CRAWLER_CACHE_NEGATIVE_TTL)
+    return signals
+
+
+async def _crawl_site(url: str, max_pages: int) -> Optional[Dict[str, Any]]:
+    try:
+        homepage = await crawl_page(url)
+    except (httpx.HTTPError, httpx.InvalidURL) as e:
+        logger.warning(f"Crawl impossible pour {url}: {e}")
+        return None
+    except Exception as e:
+        # Page tierce malformée (décodage, analyse) : l'audit continue sans signaux SEO
+        logger.error(f"Erreur inattendue lors du crawl de {url}: {e}", exc_info=True)
+        return None
+
+    pages = []
+    links = homepage.pop("internal_links")
+    if max_pages > 1:
+        results = await asyncio.gather(
+            *(crawl_page(link) for link in links[:max_pages - 1]),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, dict):
+                result.pop("internal_links", None)
+                pages.append(result)
+
+    homepage["internal_link_count"] = len(links)
+    homepage["pages"] = pages
+    return homepage
+
+
+def format_seo_signals(signals: Optional[Dict[str, Any]]) -> str:
+    """Résumé textuel des signaux SEO pour le prompt Gemini"""
+    if not signals:
+        return "Signaux SEO techniques : non disponibles."
+
+    def describe(page: Dict[str, Any]) -> List[str]:
+        return [
+            f"  - Title: {page.get('title') or 'absent'}",
+            f"  - Meta description: {page.get('meta_description') or 'absente'}",
+            f"  - H1 ({len(page.get('h1') or [])}): {' | '.join(page.get('h1') or []) or 'aucun'}",
+            f"  - Canonical: {page.get('canonical') or 'absente'}",
+            f"  - Données structurées: {', '.join(page.get('structured_data') or []) or 'aucune'}",
+            f"  - Images: {page.get('image_count', 0)} (dont {page.get('images_without_alt', 0)} sans alt)",
+            f"  - Poids de la page: {round(page.get('page_weight_bytes', 0) / 1024)} Ko"
+            f"{' (tronqué)' if page.get('truncated') else ''}",
+            f"  - TTFB: {page.get('ttfb_ms')} ms",
+        ]
+
+    lines = [f"Signaux SEO techniques de la page d'accueil ({signals.get('url')}) :"]
+    lines += describe(signals)
+    lines.append(f"  - Liens internes: {signals.get('internal_link_count', 0)}")
+    for page in signals.get("pages", []):
+        lines.append(f"Page interne {page.get('url')} :")
+        lines += describe(page)
+    return "\n".join(lines)
@@ -1,25 +1,80 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only
 from app.models_db import Audit, BusinessInfo
+from app.services.search import index_audit, remove_audit, search_audits
+import base64
 import json
+import logging
 import secrets
 import string
-from typing import Dict, List, Any, Optional
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 def generate_api_key(length: int = 32) -> str:
     """Génère une clé API unique"""
     characters = string.ascii_letters + string.digits
     return ''.join(secrets.choice(characters) for _ in range(length))
 
-def save_audit_to_db(db: Session, name: str, location: str, score: int, 
-                     strengths: List[Dict[str, str]], weaknesses: List[Dict[str, str]], 
-                     recommendations: Dict[str, List[Dict[str, str]]],
-                     business_data: Optional[Dict[str, Any]] = None,
-                     user_id: Optional[int] = None) -> Audit:
+# Tentatives d'insertion en cas de collision de clé API (garantie par l'index unique)
+API_KEY_MAX_ATTEMPTS = 3
+
+def business_info_from_data(business_data: Dict[str, Any], default_name: str = '') -> BusinessInfo:
+    """Construit la ligne BusinessInfo à partir des données SerpAPI"""
+    gps = business_data.get('gps_coordinates', {})
+    
+    return BusinessInfo(
+        name=business_data.get('name', default_name),
+        address=business_data.get('address', ''),
+        website=business_data.get('website'),
+        phone=business_data.get('phone'),
+        rating=business_data.get('rating', 0.0),
+        review_count=business_data.get('review_count', 0),
+        place_id=business_data.get('place_id'),
+        latitude=gps.get('latitude') if gps else None,
+        longitude=gps.get('longitude') if gps else None,
+        category=business_data.get('category'),
+        photos=business_data.get('photos', [])
+    )
+
+async def persist_audit(db: AsyncSession, audit: Audit, business_info: Optional[BusinessInfo] = None,
+                        make_api_key: Callable[[], str] = generate_api_key) -> Audit:
+    """
+    Insère l'audit, ses informations business et son index de recherche en une seule transaction.
+
+    L'unicité de la clé API est garantie par l'index unique : en cas de collision,
+    la transaction est annulée et rejouée avec une nouvelle clé (pas de SELECT préalable).
     """
-    Sauvegarde un audit complet en base de données
+    for attempt in range(1, API_KEY_MAX_ATTEMPTS + 1):
+        audit.api_key = make_api_key()
+        if business_info is not None:
+            audit.business_info = business_info
+        db.add(audit)
+        try:
+            # INSERT de l'audit puis des lignes dépendantes, qui ont besoin de son id
+            await db.flush()
+            await index_audit(db, audit, business_info, replace=False)
+            await db.commit()
+            return audit
+        except IntegrityError:
+            await db.rollback()
+            if attempt == API_KEY_MAX_ATTEMPTS:
+                raise
+            logger.warning(f"Collision de clé API à l'insertion de l'audit, nouvelle tentative ({attempt})")
+
+async def save_audit_to_db(db: AsyncSession, name: str, location: str, score: int, 
+                           strengths: List[Dict[str, str]], weaknesses: List[Dict[str, str]], 
+                           recommendations: Dict[str, List[Dict[str, str]]],
+                           business_data: Optional[Dict[str, Any]] = None,
+                           user_id: Optional[int] = None) -> Audit:
+    """
+    Sauvegarde un audit complet en base de données (une seule transaction)
     
     Args:
-        db: Session SQLAlchemy
+        db: Session SQLAlchemy asynchrone
         name: Nom de l'entreprise
         location: Localisation
         score: Score de l'audit
@@ -33,20 +88,12 @@ def save_audit_to_db(db: Session, name: str, location: str, score: int,
         Audit: L'audit sauvegardé avec son ID et sa clé API
     """
     
-    # Génération d'une clé API unique
-    api_key = generate_api_key()
-    
-    # Vérification de l'unicité de la clé API
-    while db.query(Audit).filter(Audit.api_key == api_key).first():
-        api_key = generate_api_key()
-    
     # Stockage en JSON des listes structurées (forces, faiblesses, recommandations)
     strengths_json = json.dumps(strengths, ensure_ascii=False)
     weaknesses_json = json.dumps(weaknesses, ensure_ascii=False)
     recommendations_json = json.dumps(recommendations, ensure_ascii=False)
     
     new_audit = Audit(
-        api_key=api_key,
         name=name,
         location=location,
         score=score,
@@ -56,84 +103,118 @@ def save_audit_to_db(db: Session, name: str, location: str, score: int,
         user_id=user_id
     )
     
-    db.add(new_audit)
-    db.commit()
-    db.refresh(new_audit)
-    
-    if business_data:
-        save_business_info(db, new_audit.id, business_data)
-    
-    return new_audit
-
-def save_business_info(db: Session, audit_id: int, business_data: Dict[str, Any]) -> BusinessInfo:
-    """
-    Sauvegarde les informations business liées à un audit
-    """
-    gps = business_data.get('gps_coordinates', {})
-    
-    business_info = BusinessInfo(
-        audit_id=audit_id,
-        name=business_data.get('name', ''),
-        address=business_data.get('address', ''),
-        website=business_data.get('website'),
-        phone=business_data.get('phone'),
-        rating=business_data.get('rating', 0.0),
-        review_count=business_data.get('review_count', 0),
-        place_id=business_data.get('place_id'),
-        latitude=gps.get('latitude') if gps else None,
-        longitude=gps.get('longitude') if gps else None,
-        category=business_data.get('category'),
-        photos=business_data.get('photos', [])
-    )
-    
-    db.add(business_info)
-    db.commit()
-    db.refresh(business_info)
-    return business_info
+    business_info = business_info_from_data(business_data) if business_data else None
+    return await persist_audit(db, new_audit, business_info)
 
-def get_audit_by_id(db: Session, audit_id: int) -> Optional[Audit]:
+async def get_audit_by_id(db: AsyncSession, audit_id: int) -> Optional[Audit]:
     """
     Récupère un audit par son ID
     """
-    return db.query(Audit).filter(Audit.id == audit_id).first()
+    result = await db.execute(select(Audit).options(joinedload(Audit.business_info)).where(Audit.id == audit_id))
+    return result.scalars().first()
 
-def get_audit_by_api_key(db: Session, api_key: str) -> Optional[Audit]:
+async def get_audit_by_api_key(db: AsyncSession, api_key: str) -> Optional[Audit]:
     """
     Récupère un audit par sa clé API
     """
-    return db.query(Audit).filter(Audit.api_key == api_key).first()
+    result = await db.execute(select(Audit).options(joinedload(Audit.business_info)).where(Audit.api_key == api_key))
+    return result.scalars().first()
 
-def get_all_audits(db: Session, skip: int = 0, limit: int = 100) -> List[Audit]:
+async def get_all_audits(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Audit]:
     """
     Récupère tous les audits avec pagination
     """
-    return db.query(Audit).offset(skip).limit(limit).all()
+    result = await db.execute(select(Audit).options(joinedload(Audit.business_info)).offset(skip).limit(limit))
+    return list(result.scalars())
 
-def get_audits_by_name(db: Session, name: str) -> List[Audit]:
+async def get_audits_by_name(db: AsyncSession, name: str, skip: int = 0, limit: int = 100) -> List[Audit]:
     """
-    Récupère tous les audits pour une entreprise donnée
+    Récupère les audits d'une entreprise donnée, les plus pertinents en premier
+    (index de trigrammes au lieu d'un ILIKE '%name%' qui parcourt toute la table)
     """
-    return db.query(Audit).filter(Audit.name.ilike(f"%{name}%")).all()
+    results, _ = await search_audits(db, name, limit=limit, offset=skip)
+    return [audit for audit, _ in results]
 
-def get_audits_by_user_id(db: Session, user_id: int, skip: int = 0, limit: int = 20) -> List[Audit]:
+async def get_audits_by_user_id(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 20) -> List[Audit]:
     """
     Récupère les audits associés à un utilisateur donné avec pagination
     """
-    return db.query(Audit).filter(Audit.user_id == user_id).offset(skip).limit(limit).all()
+    result = await db.execute(
+        select(Audit).options(joinedload(Audit.business_info))
+        .where(Audit.user_id == user_id).offset(skip).limit(limit)
+    )
+    return list(result.scalars())
+
+def encode_cursor(created_at: datetime, audit_id: int) -> str:
+    """Curseur opaque pointant après l'audit (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), audit_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Décode un curseur produit par encode_cursor, lève ValueError s'il est invalide"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, audit_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(audit_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Curseur invalide : {cursor}") from e
+
+# Colonnes des listes d'audits en mode résumé : les blobs JSON (recommandations,
+# forces, faiblesses) ne sont ni lus ni transférés
+AUDIT_SUMMARY_COLUMNS = (Audit.id, Audit.name, Audit.location, Audit.score, Audit.created_at, Audit.updated_at)
+
+async def get_audits_page_by_user(db: AsyncSession, user_id: int, limit: int = 20,
+                                  cursor: Optional[str] = None, skip: int = 0,
+                                  summary: bool = False) -> Tuple[List[Audit], Optional[str]]:
+    """
+    Page d'audits d'un utilisateur, du plus récent au plus ancien.
+
+    Avec un curseur, la page est lue par plage sur l'index (user_id, created_at, id) :
+    le coût ne dépend pas de la profondeur, contrairement à OFFSET (skip, conservé
+    pour la compatibilité quand aucun curseur n'est fourni).
+    En mode résumé, seules les colonnes AUDIT_SUMMARY_COLUMNS sont chargées.
+
+    Returns:
+        (audits, curseur de la page suivante ou None s'il n'y en a plus)
+    """
+    query = (
+        select(Audit)
+        .where(Audit.user_id == user_id)
+        .order_by(Audit.created_at.desc(), Audit.id.desc())
+    )
+    if summary:
+        query = query.options(load_only(*AUDIT_SUMMARY_COLUMNS))
+    if cursor:
+        created_at, audit_id = decode_cursor(cursor)
+        query = query.where(tuple_(Audit.created_at, Audit.id) < tuple_(created_at, audit_id))
+    elif skip:
+        query = query.offset(skip)
+
+    # Une ligne de plus pour savoir s'il existe une page suivante sans COUNT
+    audits = list((await db.execute(query.limit(limit + 1))).scalars())
+    next_cursor = None
+    if len(audits) > limit:
+        audits = audits[:limit]
+        last = audits[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return audits, next_cursor
 
-def delete_audit(db: Session, audit_id: int) -> bool:
+async def delete_audit(db: AsyncSession, audit_id: int) -> bool:
     """
     Supprime un audit et ses données associées
     """
-    audit = get_audit_by_id(db, audit_id)
+    audit = await get_audit_by_id(db, audit_id)
     if not audit:
         return False
     
-    db.query(BusinessInfo).filter(BusinessInfo.audit_id == audit_id).delete()
+    # Suppression via l'ORM : la relation sans cascade tenterait sinon de détacher business_info (audit_id NULL)
+    if audit.business_info is not None:
+        await db.delete(audit.business_info)
+    await remove_audit(db, audit_id)
     
    
-    db.delete(audit)
-    db.commit()
+    await db.delete(audit)
+    await db.commit()
     return True
 
 def audit_to_dict(audit: Audit) -> Dict[str, Any]:
@@ -0,0 +1,126 @@
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+# Les rapports adressés par contenu ne changent jamais une fois écrits
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Contenu susceptible d'être régénéré : le client revalide avec If-None-Match
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+CHUNK_SIZE = 64 * 1024
+
+
+def strong_etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 d'un fichier, mémorisé tant que sa taille et sa date de modification ne changent pas"""
+    stat = path.stat()
+    return _file_digest(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Comparaison faible, comme l'exige RFC 9110 pour If-None-Match
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Retourne l'intervalle (début, fin inclus) d'un en-tête Range "bytes=..." à un seul intervalle,
+    None pour servir le fichier entier (en-tête absent, invalide ou multi-intervalles).
+    Lève une 416 si l'intervalle ne recouvre pas le fichier.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffixe : les N derniers octets
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise ValueError
+            start, end = max(size - suffix, 0), size - 1
+    except ValueError:
+        return None
+    if start > end and end_text:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=416, detail="Intervalle non satisfaisable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+def _iter_file(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def download_response(request: Request, etag: str, filename: str, cache_control: str,
+                      content: Optional[bytes] = None, path: Optional[Path] = None,
+                      size: Optional[int] = None) -> Response:
+    """
+    Réponse de téléchargement PDF (en mémoire ou depuis un fichier) gérant
+    ETag / If-None-Match (304), Range / If-Range (206) et les en-têtes de cache.
+    """
+    headers: Dict[str, str] = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{filename}",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "Content-Disposition"})
+
+    if size is None:
+        size = len(content) if content is not None else os.path.getsize(path)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if request.method == "GET" and (not if_range or if_range.strip() == etag):
+        byte_range = parse_range(request.headers.get("range"), size)
+
+    if byte_range is None:
+        if content is not None:
+            return Response(content=content, media_type="application/pdf", headers=headers)
+        # Pas de FileResponse : elle réinterpréterait Range / If-Range de son côté
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size - 1), media_type="application/pdf", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if content is not None:
+        return Response(content=content[start:end + 1], status_code=206, media_type="application/pdf", headers=headers)
+    return StreamingResponse(_iter_file(path, start, end), status_code=206, media_type="application/pdf", headers=headers)
@@ -1,63 +1,241 @@
 # exporter.py
 
-from typing import Dict
-from datetime import datetime
-from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import time
 import unicodedata
 import os
 
-from app.services.reporter import generate_pdf_report  # ✅ importer le générateur stylisé
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.database import AsyncSessionLocal
+from app.models_db import Audit
+from app.services.pipeline import to_action_items, to_detail_items
+from app.services.report_store import report_store
+from app.services.reporter import render_pdf_report  # ✅ importer le générateur stylisé
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Nombre de processus de rendu PDF (0 : rendu dans un thread du processus courant)
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", os.cpu_count() or 1))
+MIN_PDF_SIZE = 1000
+# Cache des PDF rendus à la demande (nombre d'audits et taille totale)
+PDF_RENDER_CACHE_SIZE = int(os.getenv("PDF_RENDER_CACHE_SIZE", 128))
+PDF_RENDER_CACHE_MAX_MB = float(os.getenv("PDF_RENDER_CACHE_MAX_MB", 64))
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
 
 def slugify(value: str) -> str:
     """Nettoie les caractères spéciaux pour un nom de fichier propre"""
     value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
     return "".join(c if c.isalnum() else "_" for c in value).strip("_")
 
-def export_to_pdf(data: Dict) -> str:
-    """Génère le chemin PDF avec `generate_pdf_report()` du reporter"""
-    # Extraire les infos nécessaires
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    Pool de processus créé à la première utilisation.
+    Pas de fork : il copierait les verrous tenus par les autres threads (asyncio.to_thread, bcrypt)
+    et pourrait bloquer l'enfant ; les workers partent d'un serveur forkserver sans threads.
+    """
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_RENDER_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _pdf_pool
+
+def shutdown_pdf_pool() -> None:
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+def build_report_data(data: Dict) -> Dict:
+    """Prépare les données au format attendu par `reporter.py`"""
     business_data = data.get("business_data", {})
-    score = data.get("score", 0)
-    strengths = data.get("strengths", [])
-    weaknesses = data.get("weaknesses", [])
-    short_term = data.get("short_term", [])
-    mid_term = data.get("mid_term", [])
-    long_term = data.get("long_term", [])
-
-    # Nettoyer le nom de fichier
-    name = business_data.get("name", "entreprise")
-    safe_name = slugify(name)[:50]
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"audit_{safe_name}_{timestamp}.pdf"
-    pdf_path = Path("reports") / filename
-
-    # Préparer les données au format attendu par `reporter.py`
-    structured_data = {
+    return {
         "nom": business_data.get("name", "N/A"),
         "adresse": business_data.get("address", "N/A"),
         "site_web": business_data.get("website", "N/A"),
         "note": business_data.get("rating", "N/A"),
         "nb_avis": business_data.get("review_count", 0),
-        "score": score,
-        "forces": strengths,
-        "faiblesses": weaknesses,
-        "short_term": short_term,
-        "mid_term": mid_term,
-        "long_term": long_term,
+        "score": data.get("score", 0),
+        "forces": data.get("strengths", []),
+        "faiblesses": data.get("weaknesses", []),
+        "short_term": data.get("short_term", []),
+        "mid_term": data.get("mid_term", []),
+        "long_term": data.get("long_term", []),
+        # Date de l'audit, pas de l'instant du rendu : un même audit donne toujours le même PDF
+        "date_generation": data.get("generated_at"),
+    }
+
+async def render_pdf(structured_data: Dict) -> bytes:
+    """
+    Rend le PDF hors de la boucle d'événements : dans le pool de processus
+    (le rendu FPDF est du Python pur qui garde le GIL), ou dans un thread si PDF_RENDER_WORKERS=0.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    if PDF_RENDER_WORKERS <= 0:
+        content = await asyncio.to_thread(render_pdf_report, structured_data)
+    else:
+        try:
+            content = await loop.run_in_executor(_get_pdf_pool(), render_pdf_report, structured_data)
+        except BrokenProcessPool:
+            # Un worker est mort (OOM, signal) : le pool sera recréé au prochain rendu
+            logger.error("Pool de rendu PDF cassé, réinitialisation")
+            shutdown_pdf_pool()
+            raise
+    logger.info(f"PDF rendu en {(time.perf_counter() - started) * 1000:.0f} ms ({len(content)} octets)")
+    return content
+
+def _json_field(value, default):
+    """Champs JSON stockés en natif ou sérialisés (anciens audits enregistrés via json.dumps)"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return default
+    return value if value is not None else default
+
+def report_data_from_audit(audit: Audit) -> Dict:
+    """Reconstruit les données du rapport à partir des lignes Audit et BusinessInfo"""
+    info = audit.business_info
+    business_data = {
+        "name": info.name if info else audit.name,
+        "address": info.address if info else "N/A",
+        "website": info.website if info else "N/A",
+        "rating": info.rating if info else "N/A",
+        "review_count": info.review_count if info else 0,
     }
+    recommendations = _json_field(audit.recommandations, {})
+    if not isinstance(recommendations, dict):
+        recommendations = {}
+    return build_report_data({
+        "business_data": business_data,
+        "score": audit.score or 0,
+        "strengths": to_detail_items(_json_field(audit.strengths, [])),
+        "weaknesses": to_detail_items(_json_field(audit.weaknesses, [])),
+        "short_term": to_action_items(recommendations.get("short_term", []), priority="short_term"),
+        "mid_term": to_action_items(recommendations.get("mid_term", []), priority="mid_term"),
+        "long_term": to_action_items(recommendations.get("long_term", []), priority="long_term"),
+        "generated_at": audit.created_at,
+    })
+
+
+class PDFRenderCache:
+    """
+    Cache LRU des PDF rendus, indexé par identifiant d'audit et borné en nombre et en octets.
+    Les requêtes simultanées pour un même audit partagent un seul rendu (single-flight).
+    """
+
+    def __init__(self, maxsize: int, max_bytes: int):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self._stats = {"hits": 0, "misses": 0, "shared": 0, "renders": 0, "store_hits": 0, "evictions": 0}
+
+    async def get(self, audit_id: int) -> Optional[Dict[str, Any]]:
+        """Retourne {"filename", "content", "etag", "report_id"} ou None si l'audit n'existe pas"""
+        entry = self._data.get(audit_id)
+        if entry is not None:
+            self._data.move_to_end(audit_id)
+            self._stats["hits"] += 1
+            return entry
+
+        task = self._inflight.get(audit_id)
+        if task is None:
+            self._stats["misses"] += 1
+            # Tâche détachée : l'annulation d'une requête (client déconnecté)
+            # n'interrompt pas le rendu attendu par les autres
+            task = asyncio.create_task(self._load(audit_id))
+            self._inflight[audit_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(audit_id, None))
+        else:
+            self._stats["shared"] += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, audit_id: int) -> Optional[Dict[str, Any]]:
+        async with AsyncSessionLocal() as db:
+            loaded = await self._load_from_db(db, audit_id)
+            if loaded is None:
+                return None
+            filename, structured_data, content, report_id = loaded
+            if content is None:
+                content = await render_pdf(structured_data)
+                self._stats["renders"] += 1
+                if len(content) < MIN_PDF_SIZE:
+                    raise RuntimeError("Le fichier PDF semble corrompu ou vide.")
+                report_id = (await report_store.put(db, content, filename[:-4], audit_id)).id
+            else:
+                self._stats["store_hits"] += 1
+
+        entry = {
+            "filename": filename, "content": content, "etag": hashlib.sha256(content).hexdigest(),
+            # Accès comptabilisés sur le rapport stocké (rétention par dernier téléchargement)
+            "report_id": report_id,
+        }
+        self._put(audit_id, entry)
+        return entry
+
+    @staticmethod
+    async def _load_from_db(db: AsyncSession, audit_id: int):
+        audit = (await db.execute(
+            select(Audit).options(joinedload(Audit.business_info)).where(Audit.id == audit_id)
+        )).scalars().first()
+        if not audit:
+            return None
+        filename = f"audit_{slugify(audit.name or '')[:50] or 'entreprise'}_{audit.id}.pdf"
+        # Rendu déjà présent dans le stockage (autre worker, redémarrage) : pas de nouveau rendu
+        report = await report_store.find_for_audit(db, audit_id)
+        if report:
+            try:
+                return filename, None, await asyncio.to_thread(report_store.file_path(report).read_bytes), report.id
+            except FileNotFoundError:
+                pass
+        return filename, report_data_from_audit(audit), None, None
+
+    def _put(self, audit_id: int, entry: Dict[str, Any]) -> None:
+        size = len(entry["content"])
+        if size > self.max_bytes:
+            return
+        self.invalidate(audit_id)
+        self._data[audit_id] = entry
+        self._size += size
+        while len(self._data) > self.maxsize or self._size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._size -= len(evicted["content"])
+            self._stats["evictions"] += 1
+
+    def invalidate(self, audit_id: int) -> None:
+        entry = self._data.pop(audit_id, None)
+        if entry is not None:
+            self._size -= len(entry["content"])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"] + self._stats["shared"]
+        return {
+            **self._stats,
+            "size": len(self._data),
+            "bytes": self._size,
+            "inflight": len(self._inflight),
+            "hit_ratio": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            "maxsize": self.maxsize,
+            "max_bytes": self.max_bytes,
+        }
+
 
-    # ✅ Appel à la génération du PDF stylisé
-    try:
-        generate_pdf_report(structured_data, str(pdf_path))
-    except Exception as e:
-        raise Exception(f"Erreur lors de la génération PDF : {str(e)}")
-
-    # Validation
-    if not pdf_path.exists():
-        raise Exception("Erreur : le fichier PDF n'a pas été créé.")
-    
-    file_size = pdf_path.stat().st_size
-    if file_size < 1000:
-        raise Exception("Erreur : le fichier PDF semble corrompu ou vide.")
-
-    return str(pdf_path)
+pdf_render_cache = PDFRenderCache(PDF_RENDER_CACHE_SIZE, int(PDF_RENDER_CACHE_MAX_MB * 1024 * 1024))
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from app.database import AsyncSessionLocal
+from app.models import AuditRequest
+from app.services.pipeline import run_audit
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AUDIT_JOB_BACKEND = os.getenv("AUDIT_JOB_BACKEND", "memory")
+AUDIT_JOB_DB = os.getenv("AUDIT_JOB_DB", "audit_jobs.sqlite3")
+AUDIT_JOB_WORKERS = int(os.getenv("AUDIT_JOB_WORKERS", 4))
+# Conservation des jobs terminés (done / failed) : durée en secondes et nombre maximal en mémoire
+AUDIT_JOB_TTL = float(os.getenv("AUDIT_JOB_TTL", 3600))
+AUDIT_JOB_MAX_JOBS = int(os.getenv("AUDIT_JOB_MAX_JOBS", 1000))
+# Bail (s) d'un processus sur ses jobs : sans battement de cœur pendant ce délai, ses jobs passent en échec
+AUDIT_JOB_LEASE = float(os.getenv("AUDIT_JOB_LEASE", 60))
+
+TERMINAL_STATUSES = ("done", "failed")
+INTERRUPTED_ERROR = "Job interrompu par un redémarrage du serveur, veuillez relancer l'audit"
+
+# Avancement (en %) associé à chaque étape du pipeline
+STAGE_PROGRESS = {
+    "queued": 0,
+    "scraping": 5,
+    "business_found": 20,
+    "website_checked": 30,
+    "analysis_ready": 50,
+    "plan_ready": 70,
+    "saved": 80,
+    "pdf_ready": 95,
+    "done": 100,
+}
+
+
+class JobStore(ABC):
+    """Interface d'un stockage de jobs d'audit"""
+
+    @abstractmethod
+    async def create(self, job_id: str, request: Dict[str, Any], user_id: Optional[int]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def heartbeat(self) -> None:
+        """Renouvelle le bail du processus courant sur ses jobs"""
+
+    @abstractmethod
+    async def fail_interrupted(self) -> int:
+        """Marque en échec les jobs en attente ou en cours dont le processus a disparu ; retourne leur nombre"""
+
+
+def _new_job(job_id: str, request: Dict[str, Any], user_id: Optional[int]) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0,
+        "request": request,
+        "user_id": user_id,
+        "result": None,
+        "message": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class InMemoryJobStore(JobStore):
+    """Stockage en mémoire du processus (perdu au redémarrage)"""
+
+    def __init__(self, ttl: float = AUDIT_JOB_TTL, max_jobs: int = AUDIT_JOB_MAX_JOBS):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _prune(self) -> None:
+        """Oublie les jobs terminés expirés puis, au-delà de max_jobs, les plus anciens"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        terminal = [job_id for job_id, job in self._jobs.items() if job["status"] in TERMINAL_STATUSES]
+        # Appelé avant l'ajout d'un job : une place est réservée pour lui
+        excess = len(self._jobs) + 1 - self.max_jobs
+        for job_id in terminal:
+            if self._jobs[job_id]["updated_at"] < cutoff or excess > 0:
+                del self._jobs[job_id]
+                excess -= 1
+
+    async def create(self, job_id, request, user_id):
+        self._prune()
+        job = _new_job(job_id, request, user_id)
+        self._jobs[job_id] = job
+        return dict(job)
+
+    async def update(self, job_id, **fields):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        job["updated_at"] = datetime.utcnow()
+
+    async def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def heartbeat(self):
+        pass
+
+    async def fail_interrupted(self):
+        # Les jobs en mémoire disparaissent avec le processus
+        return 0
+
+
+class SQLiteJobStore(JobStore):
+    """Stockage SQLite local, partagé entre les workers d'un même nœud"""
+
+    JSON_FIELDS = ("request", "result")
+
+    def __init__(self, path: str, ttl: float = AUDIT_JOB_TTL, lease: float = AUDIT_JOB_LEASE):
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        # Jeton propre à ce démarrage : un PID peut être réutilisé (PID 1 après redémarrage d'un conteneur)
+        self.owner = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS audit_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress INTEGER DEFAULT 0,
+                    request TEXT,
+                    user_id INTEGER,
+                    result TEXT,
+                    message TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    owner TEXT
+                )
+                """
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS audit_job_owners (owner TEXT PRIMARY KEY, heartbeat_at TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _create(self, job: Dict[str, Any]) -> None:
+        cutoff = (datetime.utcnow() - timedelta(seconds=self.ttl)).isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM audit_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (*TERMINAL_STATUSES, cutoff)
+            )
+            # owner : démarrage du processus dont la file en mémoire porte le job
+            conn.execute(
+                "INSERT INTO audit_jobs (job_id, status, stage, progress, request, user_id, created_at, updated_at, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["job_id"], job["status"], job["stage"], job["progress"],
+                 json.dumps(job["request"], ensure_ascii=False), job["user_id"],
+                 job["created_at"].isoformat(), job["updated_at"].isoformat(), self.owner)
+            )
+
+    def _update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        fields = dict(fields)
+        for key in self.JSON_FIELDS:
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE audit_jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM audit_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job.pop("owner", None)
+        for key in self.JSON_FIELDS:
+            job[key] = json.loads(job[key]) if job[key] else None
+        job["created_at"] = datetime.fromisoformat(job["created_at"])
+        job["updated_at"] = datetime.fromisoformat(job["updated_at"])
+        return job
+
+    async def create(self, job_id, request, user_id):
+        job = _new_job(job_id, request, user_id)
+        await asyncio.to_thread(self._create, job)
+        return job
+
+    async def update(self, job_id, **fields):
+        await asyncio.to_thread(self._update, job_id, fields)
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self._get, job_id)
+
+    def _heartbeat(self) -> None:
+        now = datetime.utcnow()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO audit_job_owners (owner, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT(owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (self.owner, now.isoformat())
+            )
+            # Baux expirés depuis longtemps : leurs jobs ont déjà été marqués en échec
+            conn.execute(
+                "DELETE FROM audit_job_owners WHERE heartbeat_at < ?",
+                ((now - timedelta(seconds=self.lease + self.ttl)).isoformat(),)
+            )
+
+    def _fail_interrupted(self) -> int:
+        # Les autres workers du nœud partagent la base : seuls les jobs des baux expirés sont concernés
+        cutoff = (datetime.utcnow() - timedelta(seconds=self.lease)).isoformat()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE audit_jobs SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE status NOT IN (?, ?) AND COALESCE(owner, '') != ? AND COALESCE(owner, '') NOT IN "
+                "(SELECT owner FROM audit_job_owners WHERE heartbeat_at >= ?)",
+                (INTERRUPTED_ERROR, datetime.utcnow().isoformat(), *TERMINAL_STATUSES, self.owner, cutoff)
+            )
+        return cursor.rowcount
+
+    async def heartbeat(self):
+        await asyncio.to_thread(self._heartbeat)
+
+    async def fail_interrupted(self):
+        return await asyncio.to_thread(self._fail_interrupted)
+
+
+def create_job_store() -> JobStore:
+    """Instancie le stockage de jobs selon AUDIT_JOB_BACKEND (memory | sqlite)"""
+    if AUDIT_JOB_BACKEND == "sqlite":
+        return SQLiteJobStore(AUDIT_JOB_DB)
+    if AUDIT_JOB_BACKEND != "memory":
+        logger.warning(f"Backend de jobs inconnu '{AUDIT_JOB_BACKEND}', utilisation de la mémoire")
+    return InMemoryJobStore()
+
+
+class AuditJobQueue:
+    """File d'attente d'audits traitée par un pool de workers asyncio"""
+
+    def __init__(self, store: JobStore, workers: int = AUDIT_JOB_WORKERS):
+        self.store = store
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lease_task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self) -> None:
+        if self._tasks and not all(task.done() for task in self._tasks):
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"audit-job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"File d'audits démarrée avec {self.workers} workers")
+
+    async def submit(self, request: AuditRequest, user_id: Optional[int] = None) -> Dict[str, Any]:
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        job = await self.store.create(job_id, jsonable_encoder(request), user_id)
+        await self._queue.put(job_id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.store.get(job_id)
+
+    async def recover(self) -> None:
+        """
+        Au démarrage : prend le bail du processus puis le renouvelle périodiquement.
+        Les jobs d'un processus arrêté ne seront jamais repris : une fois son bail
+        expiré, ils passent en échec (vérifié à chaque renouvellement).
+        """
+        await self._renew_lease()
+        if self._lease_task is None or self._lease_task.done():
+            self._lease_task = asyncio.create_task(self._maintain_lease(), name="audit-job-lease")
+
+    async def _renew_lease(self) -> None:
+        await self.store.heartbeat()
+        count = await self.store.fail_interrupted()
+        if count:
+            logger.warning(f"{count} job(s) d'audit interrompu(s) par un redémarrage marqué(s) en échec")
+
+    async def _maintain_lease(self) -> None:
+        while True:
+            await asyncio.sleep(AUDIT_JOB_LEASE / 3)
+            try:
+                await self._renew_lease()
+            except Exception as e:
+                logger.error(f"Erreur lors du renouvellement du bail des jobs d'audit: {e}", exc_info=True)
+
+    async def shutdown(self) -> None:
+        tasks = self._tasks + ([self._lease_task] if self._lease_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._lease_task = None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Worker {index} : erreur inattendue sur le job {job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.store.get(job_id)
+        if job is None:
+            return
+
+        async def progress(stage: str, data: Dict[str, Any]):
+            if stage not in STAGE_PROGRESS:
+                return
+            await self.store.update(job_id, stage=stage, progress=STAGE_PROGRESS.get(stage, 0))
+
+        await self.store.update(job_id, status="running")
+        db = AsyncSessionLocal()
+        try:
+            result = await run_audit(db, AuditRequest(**job["request"]), job["user_id"], progress=progress)
+            if isinstance(result, dict) and result.get("message"):
+                await self.store.update(job_id, status="done", stage="done", progress=100, message=result["message"])
+            else:
+                await self.store.update(job_id, status="done", stage="done", progress=100, result=jsonable_encoder(result))
+        except HTTPException as e:
+            await self.store.update(job_id, status="failed", error=str(e.detail))
+        except Exception as e:
+            logger.error(f"Job d'audit {job_id} échoué : {e}", exc_info=True)
+            await self.store.update(job_id, status="failed", error="Erreur interne : voir logs.")
+        finally:
+            await db.close()
+
+
+job_queue = AuditJobQueue(create_job_store())
@@ -0,0 +1,152 @@
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import AuditRequest, AuditResponse, RecommendationsByPeriod, DetailItem
+from app.models_db import Audit
+from app.services.analyzer import analyze_data
+from app.services.reporter import build_action_plan
+from app.services.scraper import scrape_business_profile
+from app.services.db import business_info_from_data, persist_audit
+
+logger = logging.getLogger(__name__)
+
+# Callback de progression : (étape, données) -> awaitable
+ProgressCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def to_detail_items(lst):
+    result = []
+    for item in lst or []:
+        if isinstance(item, str):
+            result.append({"titre": item, "description": ""})
+        elif isinstance(item, dict):
+            titre = item.get("titre") or item.get("title") or ""
+            description = item.get("description", "")
+            result.append({"titre": titre, "description": description})
+    return result
+
+
+def to_action_items(lst, priority="medium"):
+    result = []
+    for item in lst or []:
+        if isinstance(item, str):
+            result.append({"title": item, "description": "", "priority": priority})
+        elif isinstance(item, dict):
+            title = item.get("title") or item.get("titre") or ""
+            description = item.get("description", "")
+            p = item.get("priority") or priority
+            result.append({"title": title, "description": description, "priority": p})
+    return result
+
+
+async def save_audit_and_business_info(db: AsyncSession, request: AuditRequest, analysis: dict, action_plan: dict,
+                                        strengths: list, weaknesses: list, business_data: dict,
+                                        user_id: Optional[int]) -> Audit:
+    new_audit = Audit(
+        name=request.name,
+        location=request.location,
+        score=analysis.get("score", 0),
+        recommandations=action_plan,
+        strengths=strengths,
+        weaknesses=weaknesses,
+        user_id=user_id
+    )
+    business_info = business_info_from_data(business_data, default_name=request.name) if business_data else None
+
+    # La session (expire_on_commit=False) garde l'instance chargée après le commit :
+    # id et created_at sont lus sans SELECT supplémentaire
+    return await persist_audit(db, new_audit, business_info, make_api_key=lambda: str(uuid.uuid4()))
+
+
+async def _notify(progress: Optional[ProgressCallback], stage: str, data: Optional[Dict[str, Any]] = None):
+    if progress is None:
+        return
+    try:
+        await progress(stage, data or {})
+    except Exception as e:
+        logger.warning(f"Erreur lors de la notification de progression ({stage}): {e}")
+
+
+async def run_audit(db: AsyncSession, request: AuditRequest, user_id: Optional[int] = None,
+                    progress: Optional[ProgressCallback] = None,
+                    on_token: Optional[Callable[[str], Awaitable[None]]] = None):
+    """
+    Exécute le pipeline complet d'audit : scraping → analyse → plan d'action → sauvegarde
+
+    Args:
+        db: Session SQLAlchemy asynchrone
+        request: Nom et localisation de l'entreprise
+        user_id: ID de l'utilisateur lié à l'audit (optionnel)
+        progress: Callback appelé à chaque étape du pipeline (optionnel)
+        on_token: Callback recevant les fragments de l'analyse Gemini en streaming (optionnel)
+
+    Returns:
+        AuditResponse, ou le dict de l'analyse quand celle-ci est impossible (clé "message")
+    """
+    await _notify(progress, "scraping")
+    business_data = await scrape_business_profile(request.name, request.location)
+    if not business_data:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Aucune entreprise trouvée : '{request.name}' à {request.location}"
+        )
+    await _notify(progress, "business_found", {"business_data": business_data})
+
+    analysis = await analyze_data({
+        "name": request.name,
+        "location": request.location,
+        "website": business_data.get("website"),
+        "reviews": business_data.get("reviews", [])
+    }, progress=lambda stage, data: _notify(progress, stage, data), on_token=on_token)
+
+    if analysis.get("message"):
+        return analysis
+    await _notify(progress, "analysis_ready", {"score": analysis.get("score", 0)})
+
+    action_plan = await build_action_plan(analysis)
+    await _notify(progress, "plan_ready", {"action_plan": action_plan})
+
+    strengths = to_detail_items(analysis.get("strengths", analysis.get("forces", [])))
+    weaknesses = to_detail_items(analysis.get("weaknesses", analysis.get("faiblesses", [])))
+
+    short_term = to_action_items(action_plan.get("short_term", []), priority="short_term")
+    mid_term = to_action_items(action_plan.get("mid_term", []), priority="mid_term")
+    long_term = to_action_items(action_plan.get("long_term", []), priority="long_term")
+
+    started = time.perf_counter()
+    new_audit = await save_audit_and_business_info(
+        db, request, analysis, action_plan, strengths, weaknesses,
+        business_data, user_id
+    )
+    logger.info(f"Écriture DB de l'audit {new_audit.id} : {(time.perf_counter() - started) * 1000:.1f} ms")
+    await _notify(progress, "saved", {"id": new_audit.id})
+
+    # Le PDF est rendu à la demande au premier téléchargement
+    pdf_url = f"/api/audit/{new_audit.id}/pdf"
+    await _notify(progress, "pdf_ready", {"pdf_url": pdf_url})
+
+    recommendations = RecommendationsByPeriod(
+        short_term=[DetailItem(**item) for item in to_detail_items(action_plan.get("short_term", []))],
+        mid_term=[DetailItem(**item) for item in to_detail_items(action_plan.get("mid_term", []))],
+        long_term=[DetailItem(**item) for item in to_detail_items(action_plan.get("long_term", []))]
+    )
+
+    return AuditResponse(
+        id=new_audit.id,
+        api_key=new_audit.api_key,
+        business_data=business_data,
+        score=analysis.get("score", 0),
+        strengths=strengths,
+        weaknesses=weaknesses,
+        recommendations=recommendations,
+        short_term=short_term,
+        mid_term=mid_term,
+        long_term=long_term,
+        pdf_url=pdf_url,
+        created_at=new_audit.created_at
+    )
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "rate_limits.sqlite3")
+
+# Débit par défaut (jetons par seconde, capacité du seau) de chaque fournisseur,
+# surchargeable via RATE_LIMIT_<FOURNISSEUR>_RATE et RATE_LIMIT_<FOURNISSEUR>_BURST
+DEFAULT_LIMITS = {
+    "serpapi": (5.0, 5),
+    "gemini": (1.0, 5),
+}
+
+
+def _provider_limits(provider: str) -> Tuple[float, int]:
+    rate, burst = DEFAULT_LIMITS.get(provider, (1.0, 1))
+    prefix = f"RATE_LIMIT_{provider.upper()}"
+    rate = float(os.getenv(f"{prefix}_RATE", rate))
+    burst = int(os.getenv(f"{prefix}_BURST", burst))
+    return max(rate, 1e-6), max(burst, 1)
+
+
+class RateLimitBackend(ABC):
+    """
+    Seau à jetons par fournisseur, en mode réservation : chaque appel consomme un jeton
+    immédiatement (le solde peut devenir négatif) et reçoit le délai à attendre.
+    Les appelants sont ainsi servis dans l'ordre d'arrivée, sans échec ni scrutation.
+    """
+
+    # True si reserve() fait des E/S et doit être exécuté hors de la boucle d'événements
+    blocking = False
+
+    @abstractmethod
+    def reserve(self, provider: str, rate: float, burst: int) -> float:
+        """Consomme un jeton et retourne le délai (s) à attendre avant l'appel"""
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Seaux propres au processus"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, provider, rate, burst):
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(provider, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated_at) * rate) - 1
+            self._buckets[provider] = (tokens, now)
+        return max(0.0, -tokens / rate)
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """Seaux stockés dans un fichier SQLite, partagés par tous les workers uvicorn du nœud"""
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "provider TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def reserve(self, provider, rate, burst):
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE sérialise les réservations entre processus
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Horloge murale : time.monotonic() n'est pas comparable entre processus
+                now = time.time()
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE provider = ?", (provider,)
+                ).fetchone()
+                tokens, updated_at = row if row else (float(burst), now)
+                tokens = min(float(burst), tokens + max(0.0, now - updated_at) * rate) - 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (provider, tokens, updated_at) VALUES (?, ?, ?)",
+                    (provider, tokens, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return max(0.0, -tokens / rate)
+
+
+class RateLimiter:
+    """Point de passage obligé des appels sortants vers les fournisseurs externes"""
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+        self._limits: Dict[str, Tuple[float, int]] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def limits(self, provider: str) -> Tuple[float, int]:
+        if provider not in self._limits:
+            self._limits[provider] = _provider_limits(provider)
+        return self._limits[provider]
+
+    async def acquire(self, provider: str) -> float:
+        """Attend qu'un jeton soit disponible pour ce fournisseur et retourne le temps d'attente"""
+        rate, burst = self.limits(provider)
+        if self.backend.blocking:
+            wait = await asyncio.to_thread(self.backend.reserve, provider, rate, burst)
+        else:
+            wait = self.backend.reserve(provider, rate, burst)
+
+        stats = self._stats.setdefault(provider, {"acquired": 0, "waiting": 0, "total_wait": 0.0, "max_wait": 0.0})
+        stats["acquired"] += 1
+        stats["total_wait"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+        if wait > 0:
+            logger.info(f"Limite de débit {provider} : attente de {wait:.2f}s")
+            stats["waiting"] += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                stats["waiting"] -= 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for provider, stats in self._stats.items():
+            rate, burst = self.limits(provider)
+            result[provider] = {
+                **stats,
+                "total_wait": round(stats["total_wait"], 3),
+                "max_wait": round(stats["max_wait"], 3),
+                "avg_wait": round(stats["total_wait"] / stats["acquired"], 3) if stats["acquired"] else 0.0,
+                "rate": rate,
+                "burst": burst,
+            }
+        return result
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Instancie le limiteur selon RATE_LIMIT_BACKEND (memory | sqlite)"""
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return RateLimiter(SQLiteRateLimitBackend(RATE_LIMIT_DB))
+    if RATE_LIMIT_BACKEND != "memory":
+        logger.warning(f"Backend de limitation inconnu '{RATE_LIMIT_BACKEND}', utilisation de la mémoire")
+    return RateLimiter(InMemoryRateLimitBackend())
+
+
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models_db import AuditReport, Report
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = Path(os.getenv("REPORTS_DIR", "reports"))
+# Politique de rétention (0 désactive le critère) :
+#   - âge maximal depuis la création
+#   - taille totale maximale, les rapports les moins récemment téléchargés partant en premier
+REPORT_MAX_AGE_DAYS = float(os.getenv("REPORT_MAX_AGE_DAYS", 30))
+REPORT_MAX_TOTAL_MB = float(os.getenv("REPORT_MAX_TOTAL_MB", 1024))
+# Intervalle minimal entre deux passes de rétention dans un même processus
+REPORT_RETENTION_INTERVAL = float(os.getenv("REPORT_RETENTION_INTERVAL", 300))
+# Intervalle minimal entre deux écritures des accès (compteurs et date de dernier téléchargement)
+REPORT_ACCESS_FLUSH_INTERVAL = float(os.getenv("REPORT_ACCESS_FLUSH_INTERVAL", 60))
+
+
+def write_atomic(path: Path, content: bytes) -> None:
+    """Écrit dans un fichier temporaire du même dossier puis le renomme : jamais de fichier partiel visible"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class ReportStore:
+    """
+    Stockage des rapports PDF adressé par contenu.
+
+    Chaque fichier est nommé d'après le SHA-256 de son contenu et rangé dans des
+    sous-dossiers (objects/ab/cd/<hash>.pdf) : deux rendus identiques ne sont
+    stockés qu'une fois. Les métadonnées (table reports) permettent de résoudre
+    un nom de téléchargement sans parcourir le disque et d'appliquer la rétention.
+    """
+
+    def __init__(self, root: Path, max_age_days: float = REPORT_MAX_AGE_DAYS,
+                 max_total_mb: float = REPORT_MAX_TOTAL_MB,
+                 retention_interval: float = REPORT_RETENTION_INTERVAL,
+                 access_flush_interval: float = REPORT_ACCESS_FLUSH_INTERVAL):
+        self.root = Path(root)
+        self.max_age_days = max_age_days
+        self.max_total_bytes = int(max_total_mb * 1024 * 1024)
+        self.retention_interval = retention_interval
+        self._retention_lock = asyncio.Lock()
+        self._last_retention = 0.0
+        self.access_flush_interval = access_flush_interval
+        # Accès pas encore écrits : identifiant du rapport -> téléchargements complets
+        self._pending_access: Dict[int, int] = {}
+        self._last_access_flush = 0.0
+        self._stats = {"stored": 0, "deduplicated": 0, "evicted": 0, "evicted_bytes": 0}
+
+    def object_path(self, content_hash: str) -> Path:
+        return self.root / "objects" / content_hash[:2] / content_hash[2:4] / f"{content_hash}.pdf"
+
+    def file_path(self, report: Report) -> Path:
+        return self.root / report.path
+
+    async def _find(self, db: AsyncSession, *criteria) -> Optional[Report]:
+        return (await db.execute(select(Report).where(*criteria))).scalars().first()
+
+    @staticmethod
+    async def _ensure_file(path: Path, content: bytes) -> None:
+        # Accès disque hors de la boucle d'événements
+        if not await asyncio.to_thread(path.exists):
+            await asyncio.to_thread(write_atomic, path, content)
+
+    async def put(self, db: AsyncSession, content: bytes, name_hint: str, audit_id: Optional[int] = None) -> Report:
+        """Enregistre un rapport (ou retrouve son doublon), le lie à l'audit et retourne ses métadonnées"""
+        content_hash = hashlib.sha256(content).hexdigest()
+        report = await self._find(db, Report.content_hash == content_hash)
+        if report:
+            self._stats["deduplicated"] += 1
+            await self._ensure_file(self.file_path(report), content)
+            report.last_accessed_at = datetime.utcnow()
+        else:
+            report = await self._create(db, content_hash, content, name_hint)
+        if audit_id is not None:
+            # Le rapport partagé garde ses autres audits : le lien est ajouté, jamais réaffecté
+            if await db.get(AuditReport, (audit_id, report.id)) is None:
+                db.add(AuditReport(audit_id=audit_id, report_id=report.id))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Lien créé en parallèle par un autre worker, ou audit supprimé entre-temps
+            await db.rollback()
+            report = await self._find(db, Report.content_hash == content_hash)
+        await self.maybe_enforce_retention(db)
+        return report
+
+    async def _create(self, db: AsyncSession, content_hash: str, content: bytes, name_hint: str) -> Report:
+        path = self.object_path(content_hash)
+        await self._ensure_file(path, content)
+        report = Report(
+            content_hash=content_hash,
+            filename=f"{name_hint}_{content_hash[:16]}.pdf",
+            path=path.relative_to(self.root).as_posix(),
+            size_bytes=len(content),
+        )
+        db.add(report)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Même contenu enregistré en parallèle par un autre worker
+            await db.rollback()
+            self._stats["deduplicated"] += 1
+            return await self._find(db, Report.content_hash == content_hash)
+        self._stats["stored"] += 1
+        return report
+
+    async def find_for_audit(self, db: AsyncSession, audit_id: int) -> Optional[Report]:
+        """Dernier rapport lié à l'audit"""
+        return (await db.execute(
+            select(Report).join(AuditReport, AuditReport.report_id == Report.id)
+            .where(AuditReport.audit_id == audit_id)
+            .order_by(AuditReport.created_at.desc()).limit(1)
+        )).scalars().first()
+
+    async def resolve(self, db: AsyncSession, filename: str) -> Optional[Report]:
+        """Retrouve un rapport par son nom de téléchargement"""
+        report = await self._find(db, Report.filename == filename)
+        if not report:
+            return None
+        if not await asyncio.to_thread(self.file_path(report).exists):
+            logger.warning(f"Fichier du rapport {filename} absent du disque, métadonnées supprimées")
+            await db.delete(report)
+            await db.commit()
+            return None
+        return report
+
+    async def record_access(self, db: AsyncSession, report_id: int, download: bool = True) -> None:
+        """
+        Comptabilise un accès (download : corps complet envoyé, sinon 206 ou 304).
+        Les accès sont cumulés en mémoire et écrits au plus une fois par intervalle :
+        les requêtes Range d'un même téléchargement ne déclenchent pas chacune une écriture.
+        """
+        self._pending_access[report_id] = self._pending_access.get(report_id, 0) + int(download)
+        if time.monotonic() - self._last_access_flush >= self.access_flush_interval:
+            await self.flush_access(db)
+
+    async def flush_access(self, db: AsyncSession) -> None:
+        pending, self._pending_access = self._pending_access, {}
+        self._last_access_flush = time.monotonic()
+        if not pending:
+            return
+        now = datetime.utcnow()
+        try:
+            for report_id, downloads in pending.items():
+                await db.execute(
+                    update(Report).where(Report.id == report_id)
+                    .values(download_count=func.coalesce(Report.download_count, 0) + downloads, last_accessed_at=now)
+                )
+            await db.commit()
+        except Exception as e:
+            # Statistiques d'accès seulement : le téléchargement n'échoue pas pour autant
+            logger.error(f"Erreur lors de l'enregistrement des accès aux rapports: {e}", exc_info=True)
+            await db.rollback()
+
+    async def maybe_enforce_retention(self, db: AsyncSession) -> None:
+        now = time.monotonic()
+        if now - self._last_retention < self.retention_interval:
+            return
+        if self._retention_lock.locked():
+            return
+        async with self._retention_lock:
+            try:
+                self._last_retention = now
+                await self.enforce_retention(db)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'application de la rétention des rapports: {e}", exc_info=True)
+                await db.rollback()
+
+    async def enforce_retention(self, db: AsyncSession) -> int:
+        """Supprime les rapports trop anciens puis, au-delà du quota, les moins récemment téléchargés"""
+        await self.flush_access(db)
+        evicted = 0
+        if self.max_age_days > 0:
+            cutoff = datetime.utcnow() - timedelta(days=self.max_age_days)
+            for report in (await db.execute(select(Report).where(Report.created_at < cutoff))).scalars().all():
+                evicted += await self._evict(db, report)
+            await db.flush()
+
+        if self.max_total_bytes > 0:
+            total = (await db.execute(select(func.coalesce(func.sum(Report.size_bytes), 0)))).scalar() or 0
+            if total > self.max_total_bytes:
+                query = select(Report).order_by(Report.last_accessed_at.asc(), Report.id.asc())
+                for report in (await db.execute(query)).scalars().all():
+                    if total <= self.max_total_bytes:
+                        break
+                    total -= report.size_bytes
+                    evicted += await self._evict(db, report)
+
+        await db.commit()
+        if evicted:
+            logger.info(f"Rétention des rapports : {evicted} rapport(s) supprimé(s)")
+        return evicted
+
+    async def _evict(self, db: AsyncSession, report: Report) -> int:
+        await asyncio.to_thread(self.file_path(report).unlink, missing_ok=True)
+        self._stats["evicted"] += 1
+        self._stats["evicted_bytes"] += report.size_bytes
+        await db.delete(report)
+        return 1
+
+    async def stats(self, db: Optional[AsyncSession] = None) -> Dict[str, Any]:
+        result = {
+            **self._stats,
+            "max_age_days": self.max_age_days,
+            "max_total_bytes": self.max_total_bytes,
+        }
+        if db is not None:
+            count, total = (await db.execute(
+                select(func.count(Report.id), func.coalesce(func.sum(Report.size_bytes), 0))
+            )).one()
+            result.update(count=count, total_bytes=int(total))
+        return result
+
+
+report_store = ReportStore(REPORTS_DIR)
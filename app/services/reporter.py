@@ -3,11 +3,14 @@ import json
 import logging
 import google.generativeai as genai
 from dotenv import load_dotenv
-from typing import Dict
+from typing import Dict, Optional
 from fpdf import FPDF
 from datetime import datetime
 import unicodedata
 import re
+from functools import lru_cache
+
+from app.services.ratelimit import rate_limiter
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -15,6 +18,9 @@ if not GEMINI_API_KEY:
     raise RuntimeError("GEMINI_API_KEY manquant")
 
 MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-pro")
+# "single" : le plan d'action est extrait de la réponse de l'analyse (un seul appel Gemini)
+# "split"  : le plan d'action est généré par un second appel Gemini
+AUDIT_LLM_MODE = os.getenv("AUDIT_LLM_MODE", "single")
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel(model_name=MODEL_NAME)
 
@@ -34,7 +40,27 @@ def _parse_json(text: str) -> Dict:
             logger.error("JSON mal formé après extraction: %s", e)
             return {}
 
-def generate_action_plan(analysis: Dict) -> Dict:
+def _sanitize_plan(plan: Dict) -> Dict:
+    def sanitize_list(lst):
+        if not isinstance(lst, list):
+            return []
+        result = []
+        for item in lst:
+            if not isinstance(item, dict):
+                continue
+            titre = item.get("titre") or item.get("title") or ""
+            description = item.get("description") or ""
+            if titre:
+                result.append({"titre": titre, "description": description})
+        return result
+
+    return {
+        "short_term": sanitize_list(plan.get("short_term", [])),
+        "mid_term": sanitize_list(plan.get("mid_term", [])),
+        "long_term": sanitize_list(plan.get("long_term", []))
+    }
+
+async def generate_action_plan(analysis: Dict) -> Dict:
     try:
         example_json = {
             "short_term": [
@@ -56,94 +82,170 @@ def generate_action_plan(analysis: Dict) -> Dict:
             "Ne retourne rien d'autre que ce JSON."
         )
 
-        resp = model.generate_content(prompt)
+        await rate_limiter.acquire("gemini")
+        resp = await model.generate_content_async(prompt)
         plan = _parse_json(resp.text)
 
-        def sanitize_list(lst):
-            if not isinstance(lst, list):
-                return []
-            result = []
-            for item in lst:
-                titre = item.get("titre") or item.get("title") or ""
-                description = item.get("description") or ""
-                if titre:
-                    result.append({"titre": titre, "description": description})
-            return result
-
-        return {
-            "short_term": sanitize_list(plan.get("short_term", [])),
-            "mid_term": sanitize_list(plan.get("mid_term", [])),
-            "long_term": sanitize_list(plan.get("long_term", []))
-        }
+        return _sanitize_plan(plan)
 
     except Exception as e:
         logger.error("Génération plan d'action échouée : %s", e, exc_info=True)
         return {"short_term": [], "mid_term": [], "long_term": []}
 
-def normalize_text(text: str) -> str:
-    """Normalise le texte pour le PDF en gérant les caractères Unicode"""
-    if not text:
-        return ""
+def plan_from_analysis(analysis: Dict) -> Dict:
+    """Extrait le plan d'action des recommandations déjà présentes dans l'analyse"""
+    recommendations = analysis.get("recommendations") or analysis.get("recommandations") or {}
+    if not isinstance(recommendations, dict):
+        recommendations = {}
+    return _sanitize_plan(recommendations)
+
+async def build_action_plan(analysis: Dict) -> Dict:
+    """
+    Construit le plan d'action selon AUDIT_LLM_MODE.
+    En mode "single", on réutilise la réponse de l'analyse et on ne rappelle
+    Gemini (mode "split") que si elle ne contient aucune action exploitable.
+    """
+    if AUDIT_LLM_MODE == "single":
+        plan = plan_from_analysis(analysis)
+        if any(plan.values()):
+            return plan
+        logger.warning("Plan d'action absent de l'analyse, repli sur un second appel Gemini")
+    return await generate_action_plan(analysis)
+
+# Remplacements spécifiques pour les caractères problématiques
+_TEXT_REPLACEMENTS = {
+    # Caractères arabes et spéciaux
+    '،': ',',  # Virgule arabe
+    '؟': '?',  # Point d'interrogation arabe
+    '؛': ';',  # Point-virgule arabe
+    '٪': '%',  # Pourcentage arabe
     
-    # Convertir en string si ce n'est pas déjà le cas
-    text = str(text)
+    # Caractères français
+    'œ': 'oe', 'Œ': 'OE', 'æ': 'ae', 'Æ': 'AE', 'ç': 'c', 'Ç': 'C',
+    'à': 'a', 'À': 'A', 'á': 'a', 'Á': 'A', 'â': 'a', 'Â': 'A',
+    'ã': 'a', 'Ã': 'A', 'ä': 'a', 'Ä': 'A', 'å': 'a', 'Å': 'A',
+    'é': 'e', 'É': 'E', 'è': 'e', 'È': 'E', 'ê': 'e', 'Ê': 'E',
+    'ë': 'e', 'Ë': 'E', 'í': 'i', 'Í': 'I', 'ì': 'i', 'Ì': 'I',
+    'î': 'i', 'Î': 'I', 'ï': 'i', 'Ï': 'I', 'ó': 'o', 'Ó': 'O',
+    'ò': 'o', 'Ò': 'O', 'ô': 'o', 'Ô': 'O', 'õ': 'o', 'Õ': 'O',
+    'ö': 'o', 'Ö': 'O', 'ø': 'o', 'Ø': 'O', 'ú': 'u', 'Ú': 'U',
+    'ù': 'u', 'Ù': 'U', 'û': 'u', 'Û': 'U', 'ü': 'u', 'Ü': 'U',
+    'ý': 'y', 'Ý': 'Y', 'ÿ': 'y', 'Ÿ': 'Y', 'ñ': 'n', 'Ñ': 'N',
     
-    # Remplacements spécifiques pour les caractères problématiques
-    replacements = {
-        # Caractères arabes et spéciaux
-        '،': ',',  # Virgule arabe
-        '؟': '?',  # Point d'interrogation arabe
-        '؛': ';',  # Point-virgule arabe
-        '٪': '%',  # Pourcentage arabe
-        
-        # Caractères français
-        'œ': 'oe', 'Œ': 'OE', 'æ': 'ae', 'Æ': 'AE', 'ç': 'c', 'Ç': 'C',
-        'à': 'a', 'À': 'A', 'á': 'a', 'Á': 'A', 'â': 'a', 'Â': 'A',
-        'ã': 'a', 'Ã': 'A', 'ä': 'a', 'Ä': 'A', 'å': 'a', 'Å': 'A',
-        'é': 'e', 'É': 'E', 'è': 'e', 'È': 'E', 'ê': 'e', 'Ê': 'E',
-        'ë': 'e', 'Ë': 'E', 'í': 'i', 'Í': 'I', 'ì': 'i', 'Ì': 'I',
-        'î': 'i', 'Î': 'I', 'ï': 'i', 'Ï': 'I', 'ó': 'o', 'Ó': 'O',
-        'ò': 'o', 'Ò': 'O', 'ô': 'o', 'Ô': 'O', 'õ': 'o', 'Õ': 'O',
-        'ö': 'o', 'Ö': 'O', 'ø': 'o', 'Ø': 'O', 'ú': 'u', 'Ú': 'U',
-        'ù': 'u', 'Ù': 'U', 'û': 'u', 'Û': 'U', 'ü': 'u', 'Ü': 'U',
-        'ý': 'y', 'Ý': 'Y', 'ÿ': 'y', 'Ÿ': 'Y', 'ñ': 'n', 'Ñ': 'N',
-        
-        # Guillemets et apostrophes
-        '"': '"', '"': '"', ''': "'", ''': "'", '«': '"', '»': '"',
-        
-        # Tirets
-        '–': '-', '—': '-', '−': '-',
-        
-        # Autres caractères spéciaux
-        '…': '...', '€': 'EUR', '°': 'deg', '²': '2', '³': '3',
-    }
+    # Guillemets et apostrophes
+    '"': '"', '"': '"', ''': "'", ''': "'", '«': '"', '»': '"',
     
-    # Appliquer les remplacements
-    for char, replacement in replacements.items():
-        text = text.replace(char, replacement)
+    # Tirets
+    '–': '-', '—': '-', '−': '-',
     
-    # Normaliser les caractères Unicode restants (décomposition puis recomposition)
-    try:
-        # Décomposer les caractères accentués
-        text = unicodedata.normalize('NFD', text)
-        # Supprimer les accents en gardant seulement les caractères ASCII
-        text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
-        # Recomposer
-        text = unicodedata.normalize('NFC', text)
-    except Exception as e:
-        logger.warning(f"Erreur lors de la normalisation Unicode: {e}")
+    # Autres caractères spéciaux
+    '…': '...', '€': 'EUR', '°': 'deg', '²': '2', '³': '3',
+}
+
+NORMALIZE_CACHE_SIZE = int(os.getenv("NORMALIZE_CACHE_SIZE", 2048))
+
+def _build_replacement_phases(replacements: Dict[str, str]) -> list:
+    """
+    Regroupe les remplacements d'un seul caractère consécutifs en tables str.translate,
+    en conservant l'ordre d'application des remplacements de plusieurs caractères.
+    Les remplacements sans effet (caractère remplacé par lui-même) sont ignorés.
+    """
+    phases, table = [], {}
+    for char, replacement in replacements.items():
+        if char == replacement:
+            continue
+        if len(char) == 1:
+            table[char] = replacement
+        else:
+            if table:
+                phases.append(str.maketrans(table))
+                table = {}
+            phases.append((char, replacement))
+    if table:
+        phases.append(str.maketrans(table))
+    return phases
+
+_REPLACEMENT_PHASES = _build_replacement_phases(_TEXT_REPLACEMENTS)
+_SINGLE_CHAR_REPLACEMENTS = {c: r for c, r in _TEXT_REPLACEMENTS.items() if len(c) == 1 and c != r}
+_MULTI_CHAR_TRIGGERS = frozenset(c[0] for c in _TEXT_REPLACEMENTS if len(c) > 1)
+# Les tables ne portent que sur des caractères non-ASCII : seules ces séquences sont réécrites
+_NON_ASCII_ONLY = not any(c.isascii() for c in _SINGLE_CHAR_REPLACEMENTS)
+# Sans déclencheur dans le texte, l'ordre des remplacements est indifférent : une seule
+# table suffit, à condition qu'aucun remplacement ne produise lui-même un déclencheur
+_SINGLE_PASS_SAFE = _NON_ASCII_ONLY and not any(
+    t in r for r in _TEXT_REPLACEMENTS.values() for t in _MULTI_CHAR_TRIGGERS
+)
+_NON_ASCII_RUN = re.compile(r'[^\x00-\x7F]+')
+
+def _translate_non_ascii(text: str, table) -> str:
+    """str.translate limité aux séquences non-ASCII, bien plus rapide sur du texte majoritairement ASCII"""
+    if text.isascii():
+        return text
+    return _NON_ASCII_RUN.sub(lambda match: match.group().translate(table), text)
+
+def _ascii_fold(char: str) -> str:
+    """Partie ASCII d'un caractère après décomposition NFD et suppression des accents"""
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', char)
+        if c.isascii() and unicodedata.category(c) != 'Mn'
+    )
+
+class _AsciiFoldTable(dict):
+    """
+    Table str.translate remplie à la demande : chaque caractère non-ASCII est réduit une fois
+    pour toutes à son remplacement explicite, sinon à sa partie ASCII.
+    Équivalent à NFD + suppression des Mn + NFC + filtrage ASCII sur le texte entier, car
+    aucune recomposition canonique ne peut absorber un caractère ASCII une fois les Mn retirés.
+    """
+
+    max_size = 65536
+
+    def __missing__(self, code: int) -> str:
+        char = chr(code)
+        folded = ''.join(_ascii_fold(c) for c in _SINGLE_CHAR_REPLACEMENTS.get(char, char))
+        if len(self) < self.max_size:
+            self[code] = folded
+        return folded
+
+_ASCII_FOLD_TABLE = _AsciiFoldTable()
+
+def _apply_replacements(text: str) -> str:
+    for phase in _REPLACEMENT_PHASES:
+        if isinstance(phase, tuple):
+            text = text.replace(*phase)
+        elif _NON_ASCII_ONLY:
+            text = _translate_non_ascii(text, phase)
+        else:
+            text = text.translate(phase)
+    return text
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_str(text: str) -> str:
+    # Remplacements dépendant de l'ordre (clés de plusieurs caractères) : application séquentielle
+    if not _SINGLE_PASS_SAFE or any(t in text for t in _MULTI_CHAR_TRIGGERS):
+        text = _apply_replacements(text)
     
-    # Supprimer ou remplacer les caractères non-ASCII restants
-    text = re.sub(r'[^\x00-\x7F]+', '', text)
+    # Seules les séquences non-ASCII sont réécrites : remplacements, accents supprimés,
+    # autres caractères retirés (le reste du texte est recopié tel quel)
+    text = _translate_non_ascii(text, _ASCII_FOLD_TABLE)
     
     # Nettoyer les espaces multiples
-    text = re.sub(r'\s+', ' ', text).strip()
+    return ' '.join(text.split())
+
+def normalize_text(text: str) -> str:
+    """Normalise le texte pour le PDF en gérant les caractères Unicode"""
+    if not text:
+        return ""
     
-    return text
+    # Convertir en string si ce n'est pas déjà le cas
+    return _normalize_str(str(text))
 
 class MinimalAuditPDF(FPDF):
-    def __init__(self):
+    def __init__(self, creation_date: Optional[datetime] = None):
         super().__init__()
+        self.creation_date = creation_date
+        if creation_date is not None and hasattr(self, "set_creation_date"):
+            self.set_creation_date(creation_date)  # fpdf2
         self.set_auto_page_break(auto=True, margin=30)
         
         self.primary = (0, 0, 0)        
@@ -156,6 +258,14 @@ class MinimalAuditPDF(FPDF):
         
         self.set_margins(25, 25, 25)
 
+    def _putinfo(self):
+        # fpdf 1.x horodate /CreationDate à l'instant du rendu : remplacée par la date fournie
+        start = len(self.buffer)
+        super()._putinfo()
+        if self.creation_date is not None:
+            stamp = "/CreationDate " + self._textstring("D:" + self.creation_date.strftime("%Y%m%d%H%M%S"))
+            self.buffer = self.buffer[:start] + re.sub(r"/CreationDate \([^)]*\)", lambda _: stamp, self.buffer[start:])
+
     def header(self):
         self.ln(15)
 
@@ -360,31 +470,37 @@ class MinimalAuditPDF(FPDF):
             
             self.ln(5)
 
-    def add_generation_info(self):
+    def add_generation_info(self, generated_at: Optional[datetime]):
         """Informations de génération en bas de première page"""
-        now = datetime.now()
+        if generated_at is None:
+            return
         self.set_font("Arial", "", 9)
         self.set_text_color(*self.secondary)
-        self.safe_cell(0, 6, normalize_text(f"Rapport genere le {now.strftime('%d/%m/%Y a %H:%M')}"), 
+        self.safe_cell(0, 6, normalize_text(f"Rapport genere le {generated_at.strftime('%d/%m/%Y a %H:%M')}"), 
                       ln=True, align="R")
         self.ln(10)
 
-def generate_pdf_report(data: Dict, filepath: str):
-    """Génère le rapport PDF avec design minimaliste"""
+def render_pdf_report(data: Dict) -> bytes:
+    """
+    Génère le rapport PDF avec design minimaliste et le retourne en mémoire.
+    Fonction pure (aucune E/S, ni lecture de l'horloge) : exécutable dans un processus
+    du pool de rendu, et deux rendus des mêmes données donnent les mêmes octets.
+    """
     try:
-        pdf = MinimalAuditPDF()
+        pdf = MinimalAuditPDF(creation_date=data.get("date_generation"))
         pdf.add_page()
         # Sections du rapport
-        pdf.add_generation_info()
+        pdf.add_generation_info(data.get("date_generation"))
         pdf.company_info_section(data)
         pdf.score_section(data)
         pdf.simple_list_section(data.get("forces", []), "POINTS FORTS")
         pdf.simple_list_section(data.get("faiblesses", []), "POINTS A AMELIORER")
         pdf.action_plan_section(data)
         
-        pdf.output(filepath)
-        logger.info(f"Rapport PDF minimaliste généré avec succès: {filepath}")
+        # fpdf 1.x retourne une chaîne latin-1, fpdf2 un bytearray
+        content = pdf.output(dest="S")
+        return content.encode("latin-1") if isinstance(content, str) else bytes(content)
         
     except Exception as e:
         logger.error(f"Erreur lors de la génération du PDF: {e}", exc_info=True)
-        raise RuntimeError(f"Impossible de générer le PDF: {str(e)}")  
\ No newline at end of file
+        raise RuntimeError(f"Impossible de générer le PDF: {str(e)}")
@@ -1,14 +1,32 @@
-import requests
+import copy
 import os
 from dotenv import load_dotenv
 from typing import Dict, Optional
 
+from app.services.cache import MISSING, TTLCache, normalize_key
+from app.services.http_client import get_http_client
+from app.services.ratelimit import rate_limiter
+
 load_dotenv()
 
-def scrape_business_profile(name: str, location: str) -> Optional[Dict]:
+# Cache des recherches Google Maps : TTL en secondes, taille LRU en mémoire,
+# fichier SQLite optionnel pour conserver les résultats entre redémarrages
+serpapi_cache = TTLCache(
+    "serpapi",
+    ttl=float(os.getenv("SERPAPI_CACHE_TTL", 86400)),
+    maxsize=int(os.getenv("SERPAPI_CACHE_SIZE", 1024)),
+    db_path=os.getenv("SERPAPI_CACHE_DB") or None
+)
+
+async def scrape_business_profile(name: str, location: str) -> Optional[Dict]:
     api_key = os.getenv("SERPAPI_KEY")
     if not api_key:
         raise ValueError("La clé API SerpAPI n'est pas configurée")
+
+    cache_key = normalize_key(name, location)
+    cached = await serpapi_cache.aget(cache_key)
+    if cached is not MISSING:
+        return copy.deepcopy(cached)
     
     params = {
         "engine": "google_maps",
@@ -18,7 +36,9 @@ def scrape_business_profile(name: str, location: str) -> Optional[Dict]:
         "type": "search"
     }
     try:
-        response = requests.get("https://serpapi.com/search", params=params, timeout=30)
+        await rate_limiter.acquire("serpapi")
+        client = get_http_client()
+        response = await client.get("https://serpapi.com/search", params=params, timeout=30)
         response.raise_for_status()
         data = response.json()
         if data.get("local_results"):
@@ -28,7 +48,7 @@ def scrape_business_profile(name: str, location: str) -> Optional[Dict]:
         else:
             return None  
 
-        return {
+        result = {
             "name": business.get("title"),
             "address": business.get("address"),
             "category": business.get("type", [None])[0] if isinstance(business.get("type"), list) else business.get("type"),
@@ -40,5 +60,7 @@ def scrape_business_profile(name: str, location: str) -> Optional[Dict]:
             "place_id": business.get("place_id"),
             "gps_coordinates": business.get("gps_coordinates", {})
         }
+        await serpapi_cache.aset(cache_key, result)
+        return result
     except Exception as e:
         raise Exception(f"Erreur lors du scraping: {str(e)}")
@@ -0,0 +1,119 @@
+import re
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+
+from app.models_db import Audit, AuditSearchTrigram, BusinessInfo
+from app.services.cache import normalize_key
+
+# Part minimale des trigrammes de la recherche présents dans un audit pour qu'il soit retenu
+SEARCH_MIN_SIMILARITY = 0.4
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def trigrams(text: Optional[str]) -> Set[str]:
+    """
+    Trigrammes d'un texte normalisé (casse, accents), mot par mot et avec
+    bourrage comme pg_trgm : "café" -> {"  c", " ca", "caf", "afe", "fe "}
+    """
+    grams = set()
+    for word in _WORD_RE.findall(normalize_key(text)):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def audit_trigrams(audit: Audit, business_info: Optional[BusinessInfo] = None) -> Set[str]:
+    info = business_info or audit.business_info
+    fields = [audit.name, audit.location]
+    if info is not None:
+        fields += [info.category, info.address]
+    grams = set()
+    for field in fields:
+        grams |= trigrams(field)
+    return grams
+
+
+def _index_rows(audit: Audit, business_info: Optional[BusinessInfo] = None) -> List[dict]:
+    return [
+        {"audit_id": audit.id, "trigram": gram, "user_id": audit.user_id}
+        for gram in audit_trigrams(audit, business_info)
+    ]
+
+
+async def index_audit(db: AsyncSession, audit: Audit, business_info: Optional[BusinessInfo] = None,
+                      replace: bool = True) -> None:
+    """(Ré)indexe un audit ; replace=False pour un audit tout juste inséré. L'appelant valide la transaction"""
+    if replace:
+        await remove_audit(db, audit.id)
+    rows = _index_rows(audit, business_info)
+    if rows:
+        await db.execute(insert(AuditSearchTrigram), rows)
+
+
+async def remove_audit(db: AsyncSession, audit_id: int) -> None:
+    await db.execute(delete(AuditSearchTrigram).where(AuditSearchTrigram.audit_id == audit_id))
+
+
+def rebuild_search_index(db: Session, batch_size: int = 500) -> int:
+    """Reconstruit tout l'index (audits existants avant l'index de recherche), via la session synchrone"""
+    db.query(AuditSearchTrigram).delete(synchronize_session=False)
+    count, last_id = 0, 0
+    while True:
+        audits = (
+            db.query(Audit).options(joinedload(Audit.business_info))
+            .filter(Audit.id > last_id).order_by(Audit.id).limit(batch_size).all()
+        )
+        if not audits:
+            break
+        db.bulk_insert_mappings(AuditSearchTrigram, [row for audit in audits for row in _index_rows(audit)])
+        db.commit()
+        count += len(audits)
+        last_id = audits[-1].id
+    return count
+
+
+async def search_audits(db: AsyncSession, query: str, user_id: Optional[int] = None, limit: int = 20, offset: int = 0,
+                        min_similarity: float = SEARCH_MIN_SIMILARITY) -> Tuple[List[Tuple[Audit, float]], bool]:
+    """
+    Recherche classée par similarité de trigrammes.
+
+    Seules les listes de trigrammes de la requête sont lues dans l'index : le coût dépend
+    du nombre d'audits correspondants, pas de la taille de la table audits.
+
+    Returns:
+        ([(audit, similarité entre 0 et 1)], True s'il reste des résultats après cette page)
+    """
+    grams = trigrams(query)
+    if not grams:
+        return [], False
+
+    hits = func.count(AuditSearchTrigram.trigram).label("hits")
+    ranked = select(AuditSearchTrigram.audit_id, hits).where(AuditSearchTrigram.trigram.in_(grams))
+    if user_id is not None:
+        ranked = ranked.where(AuditSearchTrigram.user_id == user_id)
+    rows = (await db.execute(
+        ranked.group_by(AuditSearchTrigram.audit_id)
+        .having(hits >= max(1, round(len(grams) * min_similarity)))
+        .order_by(hits.desc(), AuditSearchTrigram.audit_id.desc())
+        .offset(offset).limit(limit + 1)
+    )).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], False
+
+    audits = {
+        audit.id: audit
+        for audit in (await db.execute(
+            select(Audit).options(joinedload(Audit.business_info))
+            .where(Audit.id.in_([audit_id for audit_id, _ in rows]))
+        )).scalars()
+    }
+    return [
+        (audits[audit_id], round(count / len(grams), 3))
+        for audit_id, count in rows if audit_id in audits
+    ], has_more
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark du filtrage des faiblesses liées à l'absence d'avis.
+
+Compare l'implémentation historique (recherche mot-clé par mot-clé puis boucles
+imbriquées) au matcher compilé de app.services.analyzer, et vérifie que les deux
+donnent exactement les mêmes résultats.
+
+Usage : python benchmarks/bench_filter_weaknesses.py [nombre_de_faiblesses]
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app.services.analyzer import (  # noqa: E402
+    MISSING_REVIEWS_KEYWORDS, NEGATIVE_WORDS, _filter_invalid_weaknesses, _is_about_missing_reviews
+)
+
+
+def legacy_is_about_missing_reviews(combined_text: str) -> bool:
+    """Logique de détection d'origine, reprise telle quelle"""
+    is_about_missing_reviews = any(
+        keyword in combined_text for keyword in MISSING_REVIEWS_KEYWORDS
+    )
+    if not is_about_missing_reviews and "avis" in combined_text:
+        for neg_word in NEGATIVE_WORDS:
+            if neg_word in combined_text and "avis" in combined_text:
+                words = combined_text.split()
+                for i, word in enumerate(words):
+                    if neg_word in word:
+                        for j in range(i+1, min(i+6, len(words))):
+                            if "avis" in words[j]:
+                                is_about_missing_reviews = True
+                                break
+                        if is_about_missing_reviews:
+                            break
+                if is_about_missing_reviews:
+                    break
+    return is_about_missing_reviews
+
+
+VOCABULARY = [
+    "le", "site", "web", "manque", "de", "contenu", "local", "avis", "clients", "aucun", "pas",
+    "optimisation", "mobile", "zéro", "0", "balises", "sans", "réponse", "aux", "absence",
+    "mots-clés", "google", "fiche", "lente", "vitesse", "chargement", "retours", "évaluations",
+    "10", "avisés", "pasteur", "concurrence", "structure", "témoignages", "feedback",
+]
+
+REALISTIC = [
+    ("Vitesse de chargement", "Le site met plus de 4 secondes à charger sur mobile."),
+    ("Fiche Google incomplète", "Les horaires et les catégories secondaires ne sont pas renseignés."),
+    ("Pas de données structurées", "Aucun balisage LocalBusiness n'est présent sur la page d'accueil."),
+    ("Maillage interne faible", "Les pages services ne sont pas reliées entre elles ni au blog."),
+    ("Absence d'avis récents", "Peu de retours clients visibles sur la fiche Google."),
+    ("Balises title génériques", "Les pages n'ont pas de title optimisé pour la recherche locale."),
+    ("Manque de contenu local", "Aucune page ne cible les quartiers desservis."),
+    ("Pas de réponse aux avis", "Les commentaires ne reçoivent aucune réponse du gérant."),
+]
+
+
+def make_corpus(size: int, realistic_ratio: float, seed: int = 42):
+    """Faiblesses aléatoires : une part de phrases réalistes, le reste tiré du vocabulaire"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        if rng.random() < realistic_ratio:
+            title, description = rng.choice(REALISTIC)
+        else:
+            title = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(2, 6))).capitalize()
+            description = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(8, 40)))
+        corpus.append({"title": title, "description": description})
+    return corpus
+
+
+def make_fuzz_texts(size: int, seed: int = 7):
+    """Textes bruités (séparateurs variés, mots collés) pour vérifier l'équivalence"""
+    rng = random.Random(seed)
+    separators = [" ", "  ", "\t", "\n", "\x1c", "\u00a0", ""]
+    words = VOCABULARY + ["0avis", "pas-avis", "avis0", "d'avis", "l'absence"]
+    return [
+        "".join(rng.choice(separators) + rng.choice(words) for _ in range(rng.randint(0, 30))).lower()
+        for _ in range(size)
+    ]
+
+
+def check_equivalence(corpus, texts):
+    mismatches = [t for t in texts if legacy_is_about_missing_reviews(t) != _is_about_missing_reviews(t)]
+    if mismatches:
+        print(f"❌ {len(mismatches)} divergences, par exemple : {mismatches[0]!r}")
+        sys.exit(1)
+    if corpus is not None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            filtered = _filter_invalid_weaknesses(corpus, review_count=12)
+        expected = [w for w, t in zip(corpus, texts) if not legacy_is_about_missing_reviews(t)]
+        assert filtered == expected
+
+
+def bench(label: str, texts):
+    size = len(texts)
+    legacy = min(timeit.repeat(lambda: [legacy_is_about_missing_reviews(t) for t in texts], number=3, repeat=5)) / 3
+    compiled = min(timeit.repeat(lambda: [_is_about_missing_reviews(t) for t in texts], number=3, repeat=5)) / 3
+    print(f"[{label}]")
+    print(f"  Implémentation historique : {legacy * 1000:8.2f} ms ({legacy / size * 1e6:.2f} µs/faiblesse)")
+    print(f"  Matcher compilé           : {compiled * 1000:8.2f} ms ({compiled / size * 1e6:.2f} µs/faiblesse)")
+    print(f"  Accélération              : x{legacy / compiled:.1f}")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    check_equivalence(None, make_fuzz_texts(size * 4))
+    corpora = {
+        "réaliste (90 % de phrases types)": make_corpus(size, realistic_ratio=0.9),
+        "vocabulaire dense en avis/négations": make_corpus(size, realistic_ratio=0.1),
+    }
+    for label, corpus in corpora.items():
+        texts = [f"{w['title'].lower()} {w['description'].lower()}" for w in corpus]
+        check_equivalence(corpus, texts)
+        print(f"✅ Résultats identiques ({label}, {size} faiblesses)")
+
+    for label, corpus in corpora.items():
+        bench(label, [f"{w['title'].lower()} {w['description'].lower()}" for w in corpus])
+
+
+if __name__ == "__main__":
+    main()
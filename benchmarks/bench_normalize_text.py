@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la normalisation de texte utilisée pour le rendu PDF.
+
+Compare l'implémentation historique (remplacements str.replace successifs puis
+normalisation Unicode systématique) à normalize_text de app.services.reporter
+(tables str.translate limitées aux séquences non-ASCII, réduction ASCII mémorisée
+par caractère et cache), sur un contenu de rapport réaliste, et vérifie que les
+sorties sont identiques.
+
+Usage : python benchmarks/bench_normalize_text.py [nombre_de_rapports]
+"""
+
+import os
+import random
+import re
+import sys
+import timeit
+import unicodedata
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app.services.reporter import _TEXT_REPLACEMENTS, _normalize_str, normalize_text  # noqa: E402
+
+
+def legacy_normalize_text(text) -> str:
+    """Logique de normalisation d'origine, reprise telle quelle"""
+    if not text:
+        return ""
+    text = str(text)
+    for char, replacement in _TEXT_REPLACEMENTS.items():
+        text = text.replace(char, replacement)
+    try:
+        text = unicodedata.normalize('NFD', text)
+        text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+        text = unicodedata.normalize('NFC', text)
+    except Exception:
+        pass
+    text = re.sub(r'[^\x00-\x7F]+', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+SECTION_TITLES = [
+    "SCORE GLOBAL", "POINTS FORTS", "POINTS A AMELIORER", "PLAN D'ACTION",
+    "Actions immediates", "Actions a moyen terme", "Actions a long terme", "Adresse:", "Site web:",
+]
+
+SENTENCES = [
+    "Améliorer la fiche Google Business avec des photos récentes et optimisées.",
+    "Créer du contenu ciblé pour la région : « boulangerie artisanale à Sfax » — 3 pages.",
+    "Répondre systématiquement aux avis clients, en particulier aux critiques négatives…",
+    "Le site met plus de 4 secondes à charger sur mobile ; réduire le poids des images (≈ 2 Mo).",
+    "Mettre en place le balisage LocalBusiness et vérifier la cohérence NAP (nom, adresse, téléphone).",
+    "Budget estimé : 150 € par mois, objectif +20 % de visibilité à 6 mois.",
+    "Optimiser les balises title et meta description des 10 pages principales.",
+    "Ajouter une page « Qui sommes-nous ? » et une FAQ sur les services proposés.",
+    "Rue Habib Bourguiba، صفاقس 3000، تونس",
+]
+
+
+def make_report(rng: random.Random):
+    """Chaînes passées à normalize_text pour un rapport : titres répétés et descriptions variées"""
+    strings = list(SECTION_TITLES)
+    for _ in range(rng.randint(12, 20)):
+        sentence = " ".join(rng.sample(SENTENCES, rng.randint(1, 3)))
+        strings.append(f"{sentence} ({rng.randint(1, 10_000)})")
+    return strings
+
+
+def make_fuzz(size: int, seed: int = 3):
+    """Chaînes aléatoires mêlant caractères remplacés, accents, arabe, espaces exotiques"""
+    rng = random.Random(seed)
+    alphabet = list(_TEXT_REPLACEMENTS) + list("abc XYZ:,'\"\t\n\x1c  éàœ́ﬁ") + ["ص", "ß", "Ⅻ", "한"]
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))) for _ in range(size)]
+
+
+def main():
+    reports = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(42)
+    corpus = [s for _ in range(reports) for s in make_report(rng)]
+
+    for text in make_fuzz(20_000) + corpus + [0, 12.5, None, ""]:
+        expected, actual = legacy_normalize_text(text), normalize_text(text)
+        if expected != actual:
+            print(f"❌ Divergence pour {text!r} : {expected!r} != {actual!r}")
+            sys.exit(1)
+    print(f"✅ Sorties identiques ({len(corpus)} chaînes de rapport + 20000 chaînes aléatoires)")
+
+    def run_cold():
+        _normalize_str.cache_clear()
+        for text in corpus:
+            normalize_text(text)
+
+    # Re-rendu des mêmes rapports (téléchargements répétés) : chaînes déjà en cache
+    rerender = corpus[:400] * (len(corpus) // 400)
+
+    def run_warm():
+        for text in rerender:
+            normalize_text(text)
+
+    legacy = min(timeit.repeat(lambda: [legacy_normalize_text(t) for t in corpus], number=1, repeat=5))
+    legacy_rerender = min(timeit.repeat(lambda: [legacy_normalize_text(t) for t in rerender], number=1, repeat=5))
+    cold = min(timeit.repeat(run_cold, number=1, repeat=5))
+    run_warm()
+    warm = min(timeit.repeat(run_warm, number=1, repeat=5))
+    print(f"{reports} rapports, {len(corpus)} chaînes")
+    print(f"  Implémentation historique : {legacy * 1000:8.2f} ms")
+    print(f"  translate, cache vide     : {cold * 1000:8.2f} ms (x{legacy / cold:.1f})")
+    print(f"Re-rendu de {len(rerender)} chaînes déjà vues")
+    print(f"  Implémentation historique : {legacy_rerender * 1000:8.2f} ms")
+    print(f"  translate, cache chaud    : {warm * 1000:8.2f} ms (x{legacy_rerender / warm:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Vérifie que deux rendus PDF d'un même audit produisent les mêmes octets.
+
+Le stockage des rapports déduplique par SHA-256 du contenu : toute donnée
+variable d'un rendu à l'autre (horloge, /CreationDate de fpdf) rend cette
+déduplication inopérante. Les deux rendus sont espacés de plus d'une seconde
+(résolution des dates PDF) ; le script échoue si les contenus diffèrent.
+
+Usage : python benchmarks/check_pdf_determinism.py
+"""
+
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app.models_db import Audit, BusinessInfo  # noqa: E402
+from app.services.exporter import report_data_from_audit  # noqa: E402
+from app.services.reporter import render_pdf_report  # noqa: E402
+
+
+def make_audit() -> Audit:
+    audit = Audit(
+        id=1,
+        name="Boulangerie Déterministe",
+        location="Lyon",
+        score=72,
+        created_at=datetime(2024, 3, 14, 9, 26, 53),
+        strengths=[{"title": "Avis nombreux", "description": "Plus de 200 avis clients."}],
+        weaknesses=[{"title": "Site lent", "description": "Temps de chargement supérieur à 4 s."}],
+        recommandations={
+            "short_term": [{"title": "Répondre aux avis", "description": "Réponse sous 48 h."}],
+            "mid_term": [{"title": "Optimiser les images", "description": "Formats modernes."}],
+            "long_term": [{"title": "Refonte du site", "description": "Version mobile."}],
+        },
+    )
+    audit.business_info = BusinessInfo(
+        name=audit.name, address="1 rue de la République, Lyon", website="https://example.com",
+        rating=4.6, review_count=214,
+    )
+    return audit
+
+
+def main() -> None:
+    data = report_data_from_audit(make_audit())
+    first = render_pdf_report(data)
+    time.sleep(1.1)
+    second = render_pdf_report(data)
+
+    digests = [hashlib.sha256(content).hexdigest() for content in (first, second)]
+    identical = first == second
+    print(f"{'✅' if identical else '❌'} rendu 1 : {digests[0][:16]} ({len(first)} octets)")
+    print(f"{'✅' if identical else '❌'} rendu 2 : {digests[1][:16]} ({len(second)} octets)")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Vérifie l'instrumentation du pool de connexions asynchrone (InstrumentedAsyncPool).
+
+Sur une base SQLite temporaire (pilote aiosqlite), avec un pool d'une seule connexion :
+  - l'ouverture d'une connexion (ralentie artificiellement) est comptée comme temps de
+    connexion et non comme attente de place dans le pool ;
+  - une requête qui attend la connexion tenue par une autre est journalisée comme
+    obtention lente, avec sa propre route : le ContextVar renseigné par le middleware
+    doit traverser le greenlet du moteur asynchrone jusqu'à la ligne de log.
+
+Usage : python benchmarks/check_pool_wait.py
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from sqlalchemy import event, text  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from app.database import InstrumentedAsyncPool, current_route, pool_metrics  # noqa: E402
+
+CONNECT_DELAY = 0.3
+HOLD_DELAY = 0.3
+
+
+class CaptureHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+async def query(engine, route: str, hold: float = 0.0) -> None:
+    with current_route(route):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await asyncio.sleep(hold)
+
+
+async def run(engine) -> None:
+    # Première requête : ouverture d'une connexion, sans attente de place
+    await query(engine, "GET /premiere")
+    # Deux requêtes simultanées : la seconde attend la connexion tenue par la première
+    holder = asyncio.create_task(query(engine, "GET /tient", hold=HOLD_DELAY))
+    await asyncio.sleep(0.05)
+    await query(engine, "GET /attend")
+    await holder
+
+
+def main() -> None:
+    fd, path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(fd)
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}", poolclass=InstrumentedAsyncPool,
+        pool_size=1, max_overflow=0, pool_pre_ping=True,
+    )
+    event.listen(engine.sync_engine, "connect", lambda *_: time.sleep(CONNECT_DELAY))
+
+    handler = CaptureHandler()
+    logging.getLogger("app.database").addHandler(handler)
+    pool_metrics.slow_checkout_ms = 100
+    try:
+        asyncio.run(run(engine))
+        asyncio.run(engine.dispose())
+    finally:
+        os.unlink(path)
+
+    stats = pool_metrics.stats()
+    slow = [message for message in handler.messages if message.startswith("Connexion DB obtenue")]
+    checks = [
+        ("ouverture comptée en temps de connexion", stats["connects"] == 1 and stats["max_connect_ms"] >= CONNECT_DELAY * 1000),
+        ("ouverture exclue de l'attente", not any("GET /premiere" in message for message in slow)),
+        ("attente journalisée avec sa route", any("GET /attend" in message for message in slow)),
+        ("une seule obtention lente", stats["slow_checkouts"] == 1),
+    ]
+    failed = False
+    for label, ok in checks:
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} {label}")
+    print(f"   attente max {stats['max_wait_ms']} ms, connexion max {stats['max_connect_ms']} ms")
+    for message in slow:
+        print(f"   log : {message}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Compte les requêtes SQL exécutées par les endpoints de lecture des audits.
+
+Les endpoints sont appelés sur une base SQLite temporaire (pilote aiosqlite et
+pragmas du backend SQLite de l'application) peuplée d'audits (avec leurs BusinessInfo). Le script échoue si un endpoint dépasse son budget
+de requêtes, ce qui détecte les régressions N+1 et les requêtes en double.
+
+Usage : python benchmarks/check_query_counts.py [nombre_d_audits]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+
+from app.auth import get_current_user  # noqa: E402
+from app.database import count_queries, get_async_db, set_sqlite_pragmas  # noqa: E402
+from app.models_db import Audit, Base, BusinessInfo, User  # noqa: E402
+from app.routes import router  # noqa: E402
+from app.services.db import audit_to_dict, get_audits_by_user_id  # noqa: E402
+
+
+def make_app(audits: int):
+    fd, path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionLocal()
+    user = User(email="bench@example.com", hashed_password="x", nom="Bench", prenom="Query")
+    db.add(user)
+    db.commit()
+    for i in range(audits):
+        audit = Audit(
+            name=f"Entreprise {i}", location="Sfax", score=i % 100, api_key=f"key-{i}", user_id=user.id,
+            strengths=[{"titre": "Force", "description": "..."}], weaknesses=[],
+            recommandations={"short_term": [], "mid_term": [], "long_term": []},
+        )
+        audit.business_info = BusinessInfo(name=f"Entreprise {i}", address="Rue", rating=4.5, review_count=10)
+        db.add(audit)
+    db.commit()
+    user_id = user.id
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    engine.dispose()
+
+    # NullPool : chaque session ouvre sa connexion dans la boucle d'événements qui l'utilise
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+    AsyncSessionLocal = sessionmaker(
+        bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
+    async def override_get_db():
+        async with AsyncSessionLocal() as session:
+            yield session
+
+    def override_current_user():
+        # Utilisateur détaché : l'authentification n'entre pas dans le décompte
+        return user
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_async_db] = override_get_db
+    app.dependency_overrides[get_current_user] = override_current_user
+    return app, AsyncSessionLocal, user_id
+
+
+def main():
+    audits = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    app, AsyncSessionLocal, user_id = make_app(audits)
+    client = TestClient(app)
+
+    # (endpoint, budget de requêtes)
+    checks = [
+        ("/api/audit/1", 1),
+        ("/api/audit/api/key-1", 1),
+        ("/api/audit/1/recommendations", 1),
+        ("/api/user/audits?limit=20", 2),
+    ]
+    failures = 0
+    for url, budget in checks:
+        with count_queries() as counter:
+            response = client.get(url)
+        status = "✅" if response.status_code == 200 and counter["count"] <= budget else "❌"
+        failures += status == "❌"
+        print(f"{status} GET {url:<32} {response.status_code}  {counter['count']} requête(s) (budget {budget})")
+
+    # Helpers de app.services.db : la conversion en dict ne doit déclencher aucun chargement paresseux
+    async def list_audits():
+        async with AsyncSessionLocal() as db:
+            with count_queries() as counter:
+                [audit_to_dict(a) for a in await get_audits_by_user_id(db, user_id, limit=20)]
+        return counter
+
+    counter = asyncio.run(list_audits())
+    status = "✅" if counter["count"] <= 1 else "❌"
+    failures += status == "❌"
+    print(f"{status} audit_to_dict x20 (get_audits_by_user_id)   {counter['count']} requête(s) (budget 1)")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
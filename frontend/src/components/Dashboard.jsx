@@ -21,7 +21,7 @@ export default function Dashboard({ user, onConfirmLogout, onNewAudit, onViewSet
 
       console.log('Récupération des audits avec token:', token.substring(0, 20) + '...');
 
-      const response = await fetch('/api/user/audits', {
+      const response = await fetch('/api/user/audits/summary', {
         method: 'GET',
         headers: {
           'Content-Type': 'application/json',
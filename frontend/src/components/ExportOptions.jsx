@@ -21,6 +21,8 @@ export default function ExportOptions({ pdfUrl, onNewAudit }) {
       
       if (pdfUrl.startsWith('http')) {
         downloadUrl = pdfUrl;
+      } else if (pdfUrl.startsWith('/api/')) {
+        downloadUrl = `${window.location.origin}${pdfUrl}`;
       } else {
         const fileName = pdfUrl.split('/').pop().split('\\').pop();
         downloadUrl = `${window.location.origin}/api/export-pdf/${fileName}`;
@@ -85,7 +87,8 @@ export default function ExportOptions({ pdfUrl, onNewAudit }) {
 
       const blobUrl = window.URL.createObjectURL(blob);
       
-      const fileName = pdfUrl.split('/').pop().split('\\').pop() || `rapport_audit_${new Date().toISOString().split('T')[0]}.pdf`;
+      const urlFileName = pdfUrl.split('/').pop().split('\\').pop();
+      const fileName = urlFileName.endsWith('.pdf') ? urlFileName : `rapport_audit_${new Date().toISOString().split('T')[0]}.pdf`;
       
       const link = document.createElement('a');
       link.href = blobUrl;
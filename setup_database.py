@@ -14,9 +14,8 @@ sys.path.append(str(Path(__file__).parent))
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import ProgrammingError
-import pymysql
 
-from app.database import MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB
+from app.database import DATABASE_BACKEND, MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB, SQLITE_PATH
 from app.models_db import Base
 
 # Configuration des logs
@@ -25,6 +24,11 @@ logger = logging.getLogger(__name__)
 
 def create_database_if_not_exists():
     """Crée la base de données si elle n'existe pas"""
+    if DATABASE_BACKEND == "sqlite":
+        # Le fichier est créé à la première connexion : seul son dossier doit exister
+        Path(SQLITE_PATH).resolve().parent.mkdir(parents=True, exist_ok=True)
+        logger.info(f"ℹ️ Base SQLite : {Path(SQLITE_PATH).resolve()}")
+        return
     try:
         # Connexion sans spécifier la base de données
         connection_url = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/"
@@ -52,16 +56,46 @@ def create_tables():
         Base.metadata.create_all(bind=engine)
         logger.info("✅ Tables créées avec succès")
         
-        # Vérifier que les tables ont été créées
-        with engine.connect() as conn:
-            result = conn.execute(text("SHOW TABLES"))
-            tables = [row[0] for row in result]
-            logger.info(f"📋 Tables créées : {tables}")
+        # Vérifier que les tables ont été créées (inspecteur : MySQL comme SQLite)
+        from sqlalchemy import inspect
+        tables = inspect(engine).get_table_names()
+        logger.info(f"📋 Tables créées : {tables}")
+        if DATABASE_BACKEND == "sqlite":
+            with engine.connect() as conn:
+                journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+                logger.info(f"📋 Mode de journalisation SQLite : {journal_mode}")
             
     except Exception as e:
         logger.error(f"❌ Erreur lors de la création des tables : {e}")
         raise
 
+def create_missing_indexes():
+    """Crée les index déclarés dans les modèles mais absents des tables existantes"""
+    from sqlalchemy import inspect
+    from app.database import engine
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                logger.info(f"✅ Index '{index.name}' créé sur '{table.name}'")
+
+def build_search_index():
+    """Indexe pour la recherche les audits créés avant l'index de trigrammes"""
+    from app.database import SessionLocal
+    from app.models_db import Audit, AuditSearchTrigram
+    from app.services.search import rebuild_search_index
+
+    db = SessionLocal()
+    try:
+        if db.query(AuditSearchTrigram).first() is None and db.query(Audit).first() is not None:
+            count = rebuild_search_index(db)
+            logger.info(f"✅ Index de recherche construit ({count} audits)")
+    finally:
+        db.close()
+
 def test_connection():
     """Test de la connexion à la base de données"""
     try:
@@ -82,8 +116,8 @@ def main():
     # Charger les variables d'environnement
     load_dotenv()
     
-    # Vérifier que les variables d'environnement sont définies
-    required_vars = ['MYSQL_USER', 'MYSQL_PASSWORD', 'MYSQL_HOST', 'MYSQL_PORT', 'MYSQL_DB']
+    # Vérifier que les variables d'environnement sont définies (serveur MySQL uniquement)
+    required_vars = ['MYSQL_USER', 'MYSQL_PASSWORD', 'MYSQL_HOST', 'MYSQL_PORT', 'MYSQL_DB'] if DATABASE_BACKEND == "mysql" else []
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
@@ -99,6 +133,8 @@ def main():
         # Étape 2 : Créer les tables
         logger.info("📝 Étape 2 : Création des tables...")
         create_tables()
+        create_missing_indexes()
+        build_search_index()
         
         # Étape 3 : Test de connexion
         logger.info("📝 Étape 3 : Test de connexion...")